@@ -1,4 +1,3 @@
-import os
 import dash
 import dash_bootstrap_components as dbc
 from dash.dash_table.Format import Format, Scheme
@@ -6,63 +5,85 @@ from dash.exceptions import PreventUpdate
 
 import layout
 from dash import callback_context, dcc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import plotly.express as px
 
 # math
 import math
-import pandas as pd
 import numpy as np
 
 # local dependencies
 from utility import protein_io as taxaminer_files, required_functionalities as rf
 from utility import dataset as ds
+from utility.catalog import DatasetCatalog
+from utility.dataset_cache import DataSetCache
+from utility.session import SessionStore, open_store
+from utility import encoding
+from utility import pca_plots
+from utility import scatter_plots
+from utility import table_query
 from utility import transformation
+from utility import warmup
 import json
-
-import plotly.graph_objs as go
+from configparser import ConfigParser
 
 output_path = "./data/"
 base_path = "./data/"
-datasets = []
-dropdowns = []
-
-for file in os.listdir(base_path):
-    d = os.path.join(base_path, file)
-    if os.path.isdir(d):
-        datasets.append(d + "/")
-        dropdowns.append({'label': d.split("/")[-1], 'value': d + "/"})
-print("Datasets", datasets)
 
-# data set globals
-path = None
-my_dataset = ds.DataSet()
+# manifests of all datasets, without loading them
+dataset_catalog = DatasetCatalog(base_path)
+dataset_catalog.scan()
+datasets = dataset_catalog.paths()
+print("Datasets", datasets)
 
-list_of_labels = []
-label_dictionary = {}
-legend_order = {}
+# level of detail of the 3D scatter plot
+plot_config = ConfigParser()
+plot_config.read("./static/config.ini")
+point_budget = plot_config.getint('Plot', 'point_budget', fallback=0)
+rare_points = plot_config.getint('Plot', 'rare_points', fallback=10)
+# one trace per taxon or a single trace
+render_mode = plot_config.get('Plot', 'render_mode', fallback='traces')
+top_taxa = plot_config.getint('Plot', 'top_taxa', fallback=20)
+
+# camera positions of the auto-rotate animation
+rotation_path = transformation.rotation_path(-1.25, 2, 0.5,
+                                             -np.arange(0, 6.26, 0.1))
+
+# placeholder until a session picks a dataset
+empty_dataset = ds.DataSet()
+# keeps recently used datasets in memory across dataset switches, shared by
+# all sessions
+dataset_cache = DataSetCache()
+# dataset, selection and UI state of every browser session
+sessions = open_store(empty_dataset, dataset_cache.get)
 
 # load glossary once
 with open("./static/glossary.json") as f:
     glossary = json.load(f)
 
-# Global Settings
-is_select_mode = False
-is_remove_mode = False
-recent_click_data = None
-recent_click_scat_data = None
-recent_select_data = None
-last_selection = None
-is_dataset_switch = False
-lock_contigs = False
-
 # Init app
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP,
                                                 dbc.icons.FONT_AWESOME])
 app.title = "taXaminer"
+# WSGI entry point, e.g. gunicorn app:server. Several worker processes need
+# [Session] store = sqlite to share the state of the browser sessions.
+server = app.server
 
 my_layout = layout.Layout()
-app.layout = my_layout.get_layout(dropdowns, my_dataset.contigs)
+
+
+def serve_layout():
+    """
+    Build the layout on every page load, so that each browser tab gets its
+    own session id
+    :return: layout
+    """
+    return my_layout.get_layout(dataset_catalog.dropdowns(),
+                                empty_dataset.contigs, rotation_path,
+                                SessionStore.new_id())
+
+
+app.layout = serve_layout
 
 
 @app.callback(
@@ -93,16 +114,20 @@ def show_variable_description_pca(click_data):
     Input('table_selection', 'columns'),
     Input('legend_selection', 'columns'),
     Input('variable-selection', 'options'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def update_table_columns(selected_vars, sel_cols, legend_cols, options):
+def update_table_columns(selected_vars, sel_cols, legend_cols, options,
+                         session_id):
     """
     Update the column visible in all tables
     :param selected_vars: selection of dataframe columns to be shown
     :param sel_cols: current cols of 'selected' table
     :param legend_cols: current cols of 'legend'
+    :param session_id: id of the browser session
     :return: columns as list
     """
+    my_dataset = sessions.get(session_id).dataset
 
     # select table columns
     columns = []
@@ -139,7 +164,7 @@ def update_table_columns(selected_vars, sel_cols, legend_cols, options):
 
 
 @app.callback(
-    Output('table_selection', 'data'),
+    Output('selection-version', 'data'),
     Output('textarea-taxon', 'value'),
     Output('table_selection', 'active_cell'),
     Output('table-hits', 'data'),
@@ -155,10 +180,12 @@ def update_table_columns(selected_vars, sel_cols, legend_cols, options):
     State('taxa_info2', 'data'),
     State('evalue-slider', 'value'),
     State('searchbar', 'value'),
-    State('contig-selection', 'value')
+    State('contig-selection', 'value'),
+    State('session-id', 'data')
 )
 def select(click_data, click_scat_data, select_data, selection_table_cell,
-           button_reset, button_add_legend_to_select, reload, go_button, taxa_list, e_value, search_data, contigs):
+           button_reset, button_add_legend_to_select, reload, go_button, taxa_list, e_value, search_data, contigs,
+           session_id):
     """
     Common function for different modes of selection from UI elements
     :param contigs: selected contigs
@@ -172,42 +199,43 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
     :param button_reset: clickdata of the 'reset legend' button
     :param button_add_legend_to_select: clickdata of 'select visible' button
     :param reload: clickdata of the 'reload save' button
+    :param session_id: id of the browser session
     :return: updated content for textareas and tables
     """
 
     taxonomic_hits = None
     my_point = ""
     fasta_header = None
-    global recent_click_data
-    global recent_click_scat_data
-    global recent_select_data
-    global last_selection
-    global glossary
 
-    global path
+    session = sessions.get(session_id)
+    # fetched once, a concurrent dataset switch replaces session.dataset
+    my_dataset = session.dataset
+    path = my_dataset.path
     if not path:
         raise PreventUpdate
 
     changed_id = [p['prop_id'] for p in callback_context.triggered][0]
 
-    # we expect the user to use the fasta_header in the searchbar
+    # the searchbar takes g_names, fasta_headers are accepted as well
     if changed_id == "searchbar_go.n_clicks":
-        fasta_header = search_data
+        fasta_header = my_dataset.get_fasta_header(search_data)
+        if fasta_header is None:
+            fasta_header = search_data
 
     # scatter matrix select
-    if select_data and select_data != recent_select_data:
-        recent_select_data = select_data
-        for it in (select_data['points']):
-            # Node that neutral mode will also select.
-            if is_remove_mode:
-                my_dataset.unselect(it['customdata'][1])
-            else:
-                my_dataset.select(it['customdata'][1])
+    if select_data and select_data != session.recent_select_data:
+        session.recent_select_data = select_data
+        keys = [it['customdata'][1] for it in select_data['points']]
+        # Node that neutral mode will also select.
+        if session.is_remove_mode:
+            my_dataset.unselect_keys(keys)
+        else:
+            my_dataset.select_keys(keys)
     else:
         # Click in scatter matrix to select a single point.
-        if click_scat_data and click_scat_data != recent_click_scat_data:
-            recent_click_scat_data = click_scat_data
-            if is_remove_mode:
+        if click_scat_data and click_scat_data != session.recent_click_scat_data:
+            session.recent_click_scat_data = click_scat_data
+            if session.is_remove_mode:
                 my_dataset.unselect(
                     click_scat_data['points'][0]['customdata'][1])
             else:
@@ -215,23 +243,17 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
                     click_scat_data['points'][0]['customdata'][1])
 
     # plot click
-    if click_data and click_data != recent_click_data:
+    if click_data and click_data != session.recent_click_data:
         my_point = click_data['points'][0]['customdata'][1]
-        recent_click_data = click_data
+        session.recent_click_data = click_data
         fasta_header = click_data['points'][0]['customdata'][3]
 
-    # input from table of selected genes
+    # input from table of selected genes, rows are identified by g_name
     if selection_table_cell:
-        try:
-            cell = \
-                my_dataset.get_selected_data().iloc[
-                    selection_table_cell['row']][
-                    'g_name']
-            if cell != last_selection:
-                my_point = cell
-                fasta_header = my_dataset.get_fasta_header(my_point)
-        except IndexError:
-            pass
+        cell = selection_table_cell.get('row_id')
+        if cell is not None and cell != session.last_selection:
+            my_point = cell
+            fasta_header = my_dataset.get_fasta_header(my_point)
 
     # taxonomic hits
     if fasta_header:
@@ -240,20 +262,20 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
     # input from search bar
     if changed_id == "searchbar_go.n_clicks":
         my_point = search_data
+        if search_data not in my_dataset.gene_index:
+            my_point = my_dataset.get_gene_name(search_data) or search_data
 
     # Gene information
-    gene_data = my_dataset.get_data_original()
-    gene_data = gene_data.loc[my_dataset.get_data_original()['g_name']
-                              == my_point]
+    gene_data = my_dataset.get_gene_data(my_point)
 
     # generate text
     output_text = ""
-    if gene_data.size != 0:
-        output_text += "Label: " + gene_data['plot_label'].item() + "\n"
-        output_text += "Gene: " + gene_data['g_name'].item() + \
-                       " | Contig: " + gene_data['c_name'].item() + "\n"
-        output_text += "Best hit: " + str(gene_data['best_hit'].item()) + \
-                       " | e-value: " + str(gene_data['bh_evalue'].item()) + \
+    if gene_data is not None:
+        output_text += "Label: " + gene_data['plot_label'] + "\n"
+        output_text += "Gene: " + gene_data['g_name'] + \
+                       " | Contig: " + gene_data['c_name'] + "\n"
+        output_text += "Best hit: " + str(gene_data['best_hit']) + \
+                       " | e-value: " + str(gene_data['bh_evalue']) + \
                        "\n\n"
 
         """Display gene and contig coverage information"""
@@ -264,27 +286,27 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
         for i in range(len(cov_cols)):
             # contig coverage
             output_text += "Contig [" + str(i) + "]:"
-            output_text += " " + str(gene_data[cov_cols[i]].item()) + "\n"
+            output_text += " " + str(gene_data[cov_cols[i]]) + "\n"
 
             # gene coverage
             output_text += "Gene [" + str(i) + "]:"
-            output_text += " " + str(gene_data[gene_cols[i]].item()) + "\n"
+            output_text += " " + str(gene_data[gene_cols[i]]) + "\n"
 
     else:
         output_text = "No matching genes found"
 
     # select / unselect
-    if is_select_mode:
+    if session.is_select_mode:
         my_dataset.select(my_point)
-    elif is_remove_mode:
+    elif session.is_remove_mode:
         my_dataset.unselect(my_point)
 
-    last_selection = my_point
+    session.last_selection = my_point
     if changed_id == 'button_reset.n_clicks':
         my_dataset.reset_selection()
 
     # add visible taxa to selection
-    if changed_id == 'button_add_legend_to_select.n_clicks' and not is_dataset_switch:
+    if changed_id == 'button_add_legend_to_select.n_clicks' and not session.is_dataset_switch:
         # e-value filter
         e_value = 1 * math.e ** (-e_value)
         df_data = my_dataset.get_plot_data({'e-value': e_value,
@@ -296,8 +318,7 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
         else:
             genes_list = df_data[df_data.plot_label_v.isin(taxa_list)]['g_name'].tolist()
 
-        for i in genes_list:
-            my_dataset.select(i)
+        my_dataset.select_keys(genes_list)
 
     # load save
     if changed_id == 'btn-reload.n_clicks':
@@ -305,21 +326,22 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
         save_file = open(file_path, 'r')
         content = save_file.read()
         line_list = content.split("||")
-        for i in range(len(line_list)):
-            my_dataset.select(line_list[i])
+        my_dataset.select_keys(line_list)
 
     # create savefile
     if click_data:
         file_path = path + "savefile.txt"
         save_file = open(file_path, 'w+')
-        set_data = my_dataset.selection_keys
-        list_data = list(set_data)
+        list_data = my_dataset.get_selected_keys()
 
         for gene in range(len(list_data)):
             save_file.write(list_data[gene] + "||")
 
     # taxonomic hit table
-    if taxonomic_hits is not None:
+    if isinstance(taxonomic_hits, str):
+        # hits are still being loaded in the background
+        taxonomic_hits = [{'sscinames': "Loading taxonomic hits ..."}]
+    elif taxonomic_hits is not None:
         # drop unsued rows
         taxonomic_hits.drop(['qseqid', 'sseqid'], axis=1, inplace=True)
         taxonomic_hits = taxonomic_hits.to_dict('records')
@@ -331,7 +353,40 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
     else:
         seq = "No sequence data found!"
 
-    return my_dataset.get_selected_data().to_dict('records'), output_text, None, taxonomic_hits, seq
+    # the selection table fetches its page, see update_selection_table()
+    return session.next_selection_version(), output_text, None, taxonomic_hits, seq
+
+
+@app.callback(
+    Output('table_selection', 'data'),
+    Output('table_selection', 'page_count'),
+    Output('table_selection', 'page_current'),
+    Input('selection-version', 'data'),
+    Input('table_selection', 'page_current'),
+    Input('table_selection', 'sort_by'),
+    Input('table_selection', 'filter_query'),
+    State('table_selection', 'page_size'),
+    State('session-id', 'data')
+)
+def update_selection_table(version, page_current, sort_by, filter_query,
+                           page_size, session_id):
+    """
+    Fetch the visible page of the table of selected genes
+    :param version: counter of selection changes
+    :param page_current: index of the visible page
+    :param sort_by: columns to sort by
+    :param filter_query: filter of the table
+    :param page_size: rows per page
+    :param session_id: id of the browser session
+    :return: rows of the page, number of pages, index of the page
+    """
+    my_dataset = sessions.get(session_id).dataset
+    if not my_dataset.path:
+        raise PreventUpdate
+    return table_query.get_page('table_selection',
+                                my_dataset.get_selected_data(),
+                                page_current,
+                                page_size, sort_by, filter_query)
 
 
 @app.callback(
@@ -341,36 +396,39 @@ def select(click_data, click_scat_data, select_data, selection_table_cell,
     Input('button_add', 'n_clicks'),
     Input('button_remove', 'n_clicks'),
     Input('button_neutral', 'n_clicks'),
+    State('session-id', 'data')
 )
-def update_selection_mode(button_add, button_remove, button_neutral):
+def update_selection_mode(button_add, button_remove, button_neutral,
+                          session_id):
     """
     Decide whether to add or remove data points to selection or do nothing
     :param button_add: clickdata of '+' button
     :param button_remove: clickdata of 'neutral' button
     :param button_neutral: clickdata of '-' button
+    :param session_id: id of the browser session
     :return: bool values to disable certain buttons
     """
-    global is_select_mode
-    global is_remove_mode
+    session = sessions.get(session_id)
 
     # fetch button id from context
     changed_id = [p['prop_id'] for p in callback_context.triggered][0]
 
-    # update global variables
+    # update session state
     if changed_id == 'button_add.n_clicks':
-        is_select_mode = True
-        is_remove_mode = False
+        session.is_select_mode = True
+        session.is_remove_mode = False
     elif changed_id == 'button_remove.n_clicks':
-        is_select_mode = False
-        is_remove_mode = True
+        session.is_select_mode = False
+        session.is_remove_mode = True
     elif changed_id == 'button_neutral.n_clicks':
-        is_select_mode = False
-        is_remove_mode = False
-    return is_select_mode, is_remove_mode, is_select_mode == is_remove_mode
+        session.is_select_mode = False
+        session.is_remove_mode = False
+    return session.is_select_mode, session.is_remove_mode, \
+        session.is_select_mode == session.is_remove_mode
 
 
 @app.callback(
-    Output('scatter3d', 'figure'),
+    Output('scatter3d-payload', 'data'),
     Output('summary', 'value'),
     Output('contribution', 'figure'),
     Output('scree', 'figure'),
@@ -379,42 +437,53 @@ def update_selection_mode(button_add, button_remove, button_neutral):
     Output('textarea-evalue', 'value'),
     Output('contig-selection', 'options'),
     Output('contig-selection', 'value'),
+    Output('btn-detail', 'disabled'),
     Input('evalue-slider', 'value'),
     Input('dataset_select', 'value'),
     Input('colorscale-select', 'value'),
     State('slider-dot-size', 'value'),
     Input('reset-legend', 'n_clicks'),
     State('scatter3d', 'relayoutData'),
-    Input('contig-selection', 'value')
+    Input('contig-selection', 'value'),
+    Input('btn-detail', 'n_clicks'),
+    State('session-id', 'data')
 )
 def update_dataframe(value, new_path, color_root, dot_size, reset_legend,
-                     relayout, contigs):
+                     relayout, contigs, detail, session_id):
     """
     Update dataset and apply filters
     :param contigs: Selected contigs (list of str)
+    :param detail: clickdata of the 'full detail' button
     :param value: value of e-value slider
     :param new_path: path to dataset
     :param color_root: a color hex string, which define the pole label color.
     :param dot_size: size of the plot dots.
     :param reset_legend: clickdata of the 'reset legend' button
     :param relayout: custom data from scatterplot
+    :param session_id: id of the browser session
     :return: New values for UI Components
     """
 
-    global my_dataset
-    global path
+    session = sessions.get(session_id)
+    my_dataset = session.dataset
+    path = my_dataset.path
 
     # handle contig selection
-    global lock_contigs
     contig_selection = []
 
     # Indicate a change of dataset
-    global is_dataset_switch
-    is_dataset_switch = True
+    session.is_dataset_switch = True
 
     # observe which component was updated
     changed_id = [p['prop_id'] for p in callback_context.triggered][0]
 
+    # filters only affect the scatter plot
+    filter_ids = ['evalue-slider.value', 'colorscale-select.value',
+                  'reset-legend.n_clicks', 'contig-selection.value',
+                  'btn-detail.n_clicks']
+    if new_path != path:
+        filter_ids = []
+
     # update camera / legend
     update_layout = True
     if changed_id in ['colorscale-select.value', 'slider-dot-size.value']:
@@ -422,12 +491,13 @@ def update_dataframe(value, new_path, color_root, dot_size, reset_legend,
 
     # only reload the .csv if the path has changed
     if new_path != path:
-        my_dataset = ds.DataSet(new_path)
+        my_dataset = session.switch_dataset(new_path,
+                                            dataset_cache.get(new_path))
         path = new_path
         relayout = False
         contig_selection = my_dataset.contigs
         contigs = my_dataset.contigs
-        lock_contigs = True
+        session.lock_contigs = True
     else:
         contig_selection = contigs
 
@@ -437,11 +507,11 @@ def update_dataframe(value, new_path, color_root, dot_size, reset_legend,
     data = my_dataset.get_data_original()
 
     # legend selection
-    global label_dictionary, legend_order
     label_dictionary = dict.fromkeys(data['plot_label'].tolist(), True)
     if 'Unassigned' in label_dictionary:
         del label_dictionary['Unassigned']
-    legend_order = list(label_dictionary.keys())
+    session.label_dictionary = label_dictionary
+    session.legend_order = list(label_dictionary.keys())
 
     # e-value filter
     value = 1 * math.e ** (-value)
@@ -455,13 +525,33 @@ def update_dataframe(value, new_path, color_root, dot_size, reset_legend,
     else:
         header_name = 'fasta_header'
 
-    my_fig = px.scatter_3d(my_data, x='Dim.1', y='Dim.2', z='Dim.3',
-                           color='plot_label_v',
-                           hover_data=['plot_label', 'g_name', 'best_hit',
-                                       'bh_evalue', 'taxon_assignment',
-                                       'c_name'],
-                           custom_data=['taxa_color', 'g_name', 'best_hit',
-                                        header_name, 'bh_evalue'])
+    # above the point budget only a sample is plotted, selections still
+    # act on all genes
+    plot_data = my_data
+    is_sampled = bool(point_budget) and len(my_data.index) > point_budget
+    if is_sampled:
+        in_view = None
+        if changed_id == 'btn-detail.n_clicks':
+            camera = relayout.get('scene.camera', {}) if relayout else {}
+            in_view = transformation.camera_region(my_data, camera)
+        plot_data = transformation.voxel_sample(my_data, point_budget,
+                                                rare_points=rare_points,
+                                                keep=in_view)
+        print("[INFO] Plotting " + str(len(plot_data.index)) + " of " +
+              str(len(my_data.index)) + " genes")
+
+    if render_mode == 'single':
+        # one trace for all taxa, top taxa by count in the legend
+        my_fig = scatter_plots.single_trace_scatter(plot_data, my_data,
+                                                    header_name, top_taxa)
+    else:
+        my_fig = px.scatter_3d(plot_data, x='Dim.1', y='Dim.2', z='Dim.3',
+                               color='plot_label_v',
+                               hover_data=['plot_label', 'g_name', 'best_hit',
+                                           'bh_evalue', 'taxon_assignment',
+                                           'c_name'],
+                               custom_data=['taxa_color', 'g_name', 'best_hit',
+                                            header_name, 'bh_evalue'])
     # keep existing camera position.
     if relayout and 'scene.camera' in relayout:
         my_fig.update_layout(scene_camera=relayout['scene.camera'])
@@ -475,179 +565,101 @@ def update_dataframe(value, new_path, color_root, dot_size, reset_legend,
                      "Taxonomic assignment: %{customdata[6]} <br>" \
                      "Contig name: %{customdata[7]} <br> </extra>"
     my_fig.update_traces(hovertemplate=hover_template)
-    rf.set_custom_color_traces(my_fig, 0)
+    if render_mode != 'single':
+        rf.set_custom_color_traces(my_fig, 0)
 
-    # add Demo Button
+    # add Demo Button, the rotation is played clientside
     my_fig.update_layout(
         legend=dict(title=dict(text='Taxa'), itemsizing='constant'),
         updatemenus=[dict(
             type='buttons',
             y=1, x=1, xanchor='right', yanchor='bottom',
             pad=dict(t=10, r=10),
-            buttons=[dict(label='Auto-rotate',
-                          method='animate',
-                          args=[None, dict(frame=dict(duration=5, redraw=True),
-                                           transition=dict(duration=0),
-                                           fromcurrent=True,
-                                           mode='immediate')]
-                          )]
+            buttons=[dict(label='Auto-rotate', method='skip', args=[None])]
         )])
 
-    # add autorotate frames
-    frames = []
-    for t in np.arange(0, 6.26, 0.1):
-        # camera coordinates of next step
-        x, y, z = transformation.rotate_z(-1.25, 2, 0.5, -t)
-        frames.append(
-            go.Frame(layout=dict(scene_camera_eye=dict(x=x, y=y, z=z))))
-    my_fig.frames = frames
-
-    # contribution of variables
-    contribution_data = pd.read_csv(
-        new_path + "PCA_and_clustering/PCA_results/pca_loadings.csv")
-    labels_pca = list(contribution_data.iloc[:, 0])
-
-    # PCA plot
-    details_list = []
-    for i in labels_pca:
-        clean_name, my_number = my_dataset.clean_trailing_indices(i)
-
-        if clean_name in glossary:
-            labels_pca[labels_pca.index(i)] = glossary[clean_name]['short'] + " " + my_number
-            details_list.append(glossary[clean_name]["details"])
-        else:
-            details_list.append("")
-
-    pc1 = contribution_data.get("PC1")
-    pc2 = contribution_data.get("PC2")
-    pc3 = contribution_data.get("PC3")
-    pc_len = (len(pc3) if len(pc3) < len(pc1) else len(pc1)) if len(pc1) < len(pc2) else \
-        (len(pc3) if len(pc3) < len(pc2) else len(pc2))
-
-    contribution_fig = px.scatter_3d(contribution_data,
-                                     title="Contribution of variables",
-                                     x="PC1", y="PC2", z="PC3",
-                                     range_x=[-1, 1], range_y=[-1, 1],
-                                     range_z=[-1, 1],
-                                     color=labels_pca,
-                                     hover_data=[details_list],
-                                     height=550)
-
-    # get points
-    point_list_x = []
-    point_list_y = []
-    point_list_z = []
-
-    # populate lists
-    for x in range(pc_len):
-        point_list_x.append(pc1[x])
-        point_list_y.append(pc2[x])
-        point_list_z.append(pc3[x])
-
-    # calc x,y,z
-    vector_list_x = []
-    vector_list_y = []
-    vector_list_z = []
-    for i in range(pc_len):
-        vector_list_x.append(0)
-        vector_list_x.append(point_list_x[i])
-        vector_list_y.append(0)
-        vector_list_y.append(point_list_y[i])
-        vector_list_z.append(0)
-        vector_list_z.append(point_list_z[i])
-
-    # update Scatter
-    contribution_fig.add_traces(go.Scatter3d(name="Arrows", mode="lines",
-                                             x=vector_list_x,
-                                             y=vector_list_y,
-                                             z=vector_list_z,
-                                             showlegend=True,
-                                             hoverinfo='skip'))
-
-    contribution_fig.update_traces(textposition='top center',
-                                   marker_size=5,
-                                   hovertemplate=None)
-    # legend
-    contribution_fig.update_layout(legend=dict(orientation="v",
-                                               itemsizing='constant'))
-
-    # scree plot
-    pca_data = pd.read_csv(
-        new_path + "PCA_and_clustering/PCA_results/pca_summary.csv")
-    pca_resolution = 5
-    proportion_of_variance = []
-    pca_ids = []
-    for i in range(1, pca_resolution + 1):
-        curr_value = pca_data.get("PC" + str(i))
-        pca_ids.append("PC" + str(i))
-        proportion_of_variance.append(curr_value[1])
-
-    pca_data = pd.DataFrame(proportion_of_variance, pca_ids)
-    scree_fig = px.bar(pca_data,
-                       title="Scree Plot",
-                       height=300)
-    scree_fig.update_layout(yaxis_title="Contribution to total variance",
-                            showlegend=False)
-
-    # load summary information
-    try:
-        with open(new_path + 'gene_info/summary.txt') as f:
-            summary = f.readlines()
-    except FileNotFoundError:
-        summary = "File summary.txt not found"
-    summary = "".join(summary)
+    # PCA plots and summary only change with the dataset
+    if changed_id in filter_ids:
+        summary = contribution_fig = scree_fig = variables = dash.no_update
+    else:
+        summary, contribution_fig, scree_fig = pca_plots.get_pca_artifacts(
+            new_path, my_dataset, glossary)
+        # variable selector
+        variables = my_dataset.get_selectable_variables()
 
     # update legend / selection / view flag
     my_fig.layout.uirevision = not update_layout
 
-    # variable selector
-    variables = my_dataset.get_selectable_variables()
-
     # reset the legend dictionary
     if changed_id == reset_legend:
         for i in label_dictionary:
             label_dictionary[i] = False
 
-    # set n_clicks = 0 to toggle plot table reload
-    return my_fig, summary, contribution_fig, scree_fig, variables, 0, \
-           str(value), my_dataset.contigs, contig_selection
+    # set n_clicks = 0 to toggle plot table reload, full detail only
+    # applies to sampled plots
+    return encoding.prepare_figure(my_fig, "scatter3d", len(plot_data)), summary, contribution_fig, scree_fig, variables, 0, \
+           str(value), my_dataset.contigs, contig_selection, not is_sampled
 
 
 @app.callback(
-    Output('scatter_matrix', 'figure'),
+    Output('scatter_matrix-payload', 'data'),
     Input('evalue-slider', 'value'),
-    Input('scatter3d', 'figure'),
-    Input('table_selection', 'data')
+    Input('scatter3d-payload', 'modified_timestamp'),
+    State('session-id', 'data')
 )
-def updateScatterMatrix(value, scat_3d, legend):
+def updateScatterMatrix(value, scat_3d, session_id):
     """
-     Update scatter matrix with current selection.
+     Build the scatter matrix for the current filters, selection changes are
+     sent by updateScatterMatrixSelection().
     :param value: Value of e-value slider.
-    :param scat_3d: scat_3d figure to trigger graph updates.
-    :param legend: legend_selection columns changes trigger.
+    :param scat_3d: update time of the scat_3d figure to trigger graph updates.
+    :param session_id: id of the browser session
     :return:
     """
-    global my_dataset
+    my_dataset = sessions.get(session_id).dataset
     value = 1 * math.e ** (-value)
     my_data = my_dataset.get_plot_data({'e-value': value})
-    scatter_side = px.scatter_matrix(my_dataset.selected_merge(my_data),
-                                     dimensions=['Dim.1', 'Dim.2', 'Dim.3'],
-                                     color='selected',
-                                     custom_data=['selected', 'g_name'])
-
-    scatter_side.update_traces(hovertemplate='%{customdata[1]}<br>%{xaxis.title.text}=%{x}<br>%{yaxis.title.text}=%{'
-                                             'y}<extra></extra>',
-                               showlegend=False)
-
-    # Override random plotly colors, because they going crazy.
-    for it in range(0, len(scatter_side.data)):
-        if scatter_side.data[it]['customdata'][0][0]:
-            scatter_side.data[it]['marker']['color'] = "#DC143C"
-        else:
-            pass
-            scatter_side.data[it]['marker']['color'] = "#636efa"
+    scatter_side = scatter_plots.scatter_matrix(
+        my_data, my_dataset.selection.is_selected(my_data))
+    return encoding.prepare_figure(scatter_side, "scatter_matrix", len(my_data))
+
+
+@app.callback(
+    Output('scatter_matrix-mask', 'data'),
+    Input('selection-version', 'data'),
+    State('evalue-slider', 'value'),
+    State('session-id', 'data')
+)
+def updateScatterMatrixSelection(version, value, session_id):
+    """
+    Send the selection state of the scatter matrix points as bit mask
+    :param version: counter of selection changes
+    :param value: Value of e-value slider.
+    :param session_id: id of the browser session
+    :return: packed mask
+    """
+    my_dataset = sessions.get(session_id).dataset
+    value = 1 * math.e ** (-value)
+    # memoized, same rows as the scatter matrix
+    my_data = my_dataset.get_plot_data({'e-value': value})
+    return scatter_plots.mask_payload(my_dataset.selection.is_selected(my_data))
 
-    return scatter_side
+
+# decode figure payloads, see utility/encoding.py
+app.clientside_callback(
+    ClientsideFunction(namespace='encoding', function_name='decode_figure'),
+    Output('scatter3d', 'figure'),
+    Input('scatter3d-payload', 'data'))
+
+app.clientside_callback(
+    ClientsideFunction(namespace='encoding', function_name='decode_figure'),
+    Output('scatter_matrix', 'figure'),
+    Input('scatter_matrix-payload', 'data'))
+
+app.clientside_callback(
+    ClientsideFunction(namespace='encoding', function_name='apply_mask'),
+    Output('dummy-4', 'children'),
+    Input('scatter_matrix-mask', 'data'))
 
 
 @app.callback(
@@ -662,36 +674,51 @@ def callbackChainTaxa(data):
 
 @app.callback(
     Output('legend_selection', 'data'),
+    Output('legend_selection', 'page_count'),
+    Output('legend_selection', 'page_current'),
     Input('btn-sync', 'n_clicks'),
+    Input('legend_selection', 'page_current'),
+    Input('legend_selection', 'sort_by'),
+    Input('legend_selection', 'filter_query'),
+    State('legend_selection', 'page_size'),
     State('taxa_info2', 'data'),
     State('evalue-slider', 'value'),
-    State('contig-selection', 'value')
+    State('contig-selection', 'value'),
+    State('session-id', 'data')
 )
-def display_click_data(clicks, taxa_list, e_value, contigs):
+def display_click_data(clicks, page_current, sort_by, filter_query, page_size,
+                       taxa_list, e_value, contigs, session_id):
     """
     function to update the table with the Taxa visble in plot
     :param clicks dash button n_clicks
+    :param page_current: index of the visible page
+    :param sort_by: columns to sort by
+    :param filter_query: filter of the table
+    :param page_size: rows per page
     :param taxa_list: contains all visible taxa
-    :return: updated dataset to build the table new according to the visible parts of the legend
+    :param session_id: id of the browser session
+    :return: visible page of the genes of the visible parts of the legend, number of pages, index of the page
     """
-    global is_dataset_switch
-    global my_dataset
-    global path
+    session = sessions.get(session_id)
+    my_dataset = session.dataset
 
     changed_id = [p['prop_id'] for p in callback_context.triggered][0]
 
-    if changed_id != 'btn-sync.n_clicks':
+    if changed_id not in ['btn-sync.n_clicks',
+                          'legend_selection.page_current',
+                          'legend_selection.sort_by',
+                          'legend_selection.filter_query']:
         raise PreventUpdate
 
     # there is no current data
-    if not path:
-        return None
+    if not my_dataset.path:
+        return None, 1, 0
 
     # init an empty table on dataset switch
-    if is_dataset_switch:
+    if session.is_dataset_switch and changed_id == 'btn-sync.n_clicks':
         # toggle
-        is_dataset_switch = False
-        return None
+        session.is_dataset_switch = False
+        return None, 1, 0
 
     # e-value filter
     e_value = 1 * math.e ** (-e_value)
@@ -699,10 +726,15 @@ def display_click_data(clicks, taxa_list, e_value, contigs):
                                         'contigs': contigs})
 
     # removing error at the start of the program
-    if taxa_list is None:
-        return df_data.to_dict('records')
+    table_data = df_data
+    if taxa_list is not None:
+        table_data = df_data[df_data.plot_label_v.isin(taxa_list)]
 
-    return df_data[df_data.plot_label_v.isin(taxa_list)].to_dict('records')
+    # row order is kept per plot data and legend state while paging
+    taxa_key = tuple(taxa_list) if taxa_list is not None else None
+    return table_query.get_page('legend_selection', table_data, page_current,
+                                page_size, sort_by, filter_query,
+                                source=df_data, source_key=taxa_key)
 
 
 @app.callback(
@@ -728,21 +760,20 @@ def print_link(click_data):
 @app.callback(
     Output("download-selection", "data"),
     Input('btn-download', 'n_clicks'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def download(click_data):
+def download(click_data, session_id):
     """
     Compile a new .fasta file of as-sequences based on the users selection
     :param click_data: data from the corresponding button
+    :param session_id: id of the browser session
     :return: dcc.send_file
     """
-    fasta_header = []
-    key_list = list(my_dataset.selection_keys)
-
-    # replace by headers
-    for key in key_list:
-        fasta_header.append(my_dataset.get_fasta_header(key))
-    link = taxaminer_files.write_protein_sequences(fasta_header, path)
+    my_dataset = sessions.get(session_id).dataset
+    fasta_header = my_dataset.get_selected_fasta_headers()
+    link = taxaminer_files.write_protein_sequences(fasta_header,
+                                                   my_dataset.path)
     return dcc.send_file(link)
 
 
@@ -750,13 +781,15 @@ def download(click_data):
     Output("download-csv", "data"),
     Input('btn-csv', 'n_clicks'),
     Input('variable-selection', 'value'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def download_csv(click_data, cols):
+def download_csv(click_data, cols, session_id):
     """
     Download a section of the pandas dataframe as defined by the selection
     table
     :param click_data:
+    :param session_id: id of the browser session
     :return: dcc.sendfile()
     """
 
@@ -766,7 +799,8 @@ def download_csv(click_data, cols):
         return None
 
     # build download link
-    link = my_dataset.export_csv(cols, path)
+    my_dataset = sessions.get(session_id).dataset
+    link = my_dataset.export_csv(cols, my_dataset.path)
     return dcc.send_file(link)
 
 
@@ -787,14 +821,33 @@ def update_diamond_columns(selected_vars):
     return columns
 
 
+@app.callback(
+    Output('dataset_select', 'options'),
+    Output('dataset_startup_select', 'options'),
+    Input('btn-rescan', 'n_clicks'),
+    prevent_initial_call=True
+)
+def rescan_datasets(clicks):
+    """
+    Look for new datasets and refresh size / cache state in the dropdowns
+    :param clicks: clickdata of the 'rescan' button
+    :return: dropdown options
+    """
+    dataset_catalog.scan()
+    options = dataset_catalog.dropdowns()
+    return options, options
+
+
 @app.callback(
     Output('searchbar', 'invalid'),
     Output('searchbar', 'valid'),
-    Input('searchbar', 'value')
+    Input('searchbar', 'value'),
+    State('session-id', 'data')
 )
-def update_searchbar(query):
+def update_searchbar(query, session_id):
     """Check if a query is a valid gene name and recolor the searchbar accordingly"""
-    if query in my_dataset.gene_names:
+    my_dataset = sessions.get(session_id).dataset
+    if query in my_dataset.gene_index or query in my_dataset.header_index:
         return False, True
     else:
         return True, False
@@ -835,7 +888,12 @@ app.clientside_callback("""
         for (it = 0; it < fig['data'].length; it++){
             if(fig['data'][it]['visible'] === undefined || fig['data'][it]['visible'] == true){  
                 data_size += fig['data'][it]['x'].length
-                list_visible.push(fig['data'][it]['name'])
+                // single trace plots list the taxa of the trace in meta
+                if(Array.isArray(fig['data'][it]['meta'])){
+                    list_visible = list_visible.concat(fig['data'][it]['meta'])
+                } else {
+                    list_visible.push(fig['data'][it]['name'])
+                }
             }
         }
         
@@ -905,6 +963,54 @@ app.clientside_callback("""
                         Input('scatter3d', 'relayoutData'),
                         State('scatter3d', 'figure'))
 
+app.clientside_callback("""
+    function(fig, path){
+        // Play the auto-rotate animation when its button in the plot is
+        // clicked, a second click stops it.
+        // :param fig scatter3d figure
+        // :param path precomputed camera positions
+        var scatDiv = document.getElementById('scatter3d')
+        if(scatDiv == undefined || scatDiv.children == undefined || scatDiv.children.length < 2){return "";}
+        var graphDiv = scatDiv.children[1]
+        graphDiv._rotation_path = path
+
+        if(graphDiv.on !== undefined && !graphDiv._rotation_listener){
+            graphDiv._rotation_listener = true
+            graphDiv.on('plotly_buttonclicked', function(event){
+                if(event.button.label !== 'Auto-rotate'){return;}
+                if(graphDiv._rotation_step !== undefined){
+                    graphDiv._rotation_step = undefined
+                    return;
+                }
+                graphDiv._rotation_step = 0
+                var step = function(){
+                    var i = graphDiv._rotation_step
+                    var p = graphDiv._rotation_path
+                    if(i === undefined || p === undefined || i >= p['x'].length){
+                        graphDiv._rotation_step = undefined
+                        return;
+                    }
+                    graphDiv._rotation_step = i + 1
+                    window.Plotly.relayout(graphDiv, {'scene.camera.eye': {x: p['x'][i], y: p['y'][i], z: p['z'][i]}})
+                        .then(function(){window.requestAnimationFrame(step)})
+                }
+                window.requestAnimationFrame(step)
+            })
+        }
+        return "";
+    }
+    """,
+                        Output('dummy-3', 'children'),
+                        Input('scatter3d', 'figure'),
+                        State('rotation-path', 'data'))
+
 
 if __name__ == "__main__":
+    # optionally build the caches of all datasets before serving. Not done on
+    # import, WSGI workers would each start their own pool, use
+    # 'python -m utility.warmup' with those.
+    prewarm, prewarm_workers = warmup.is_enabled()
+    if prewarm and not warmup.is_reloader_child():
+        warmup.prewarm(datasets, prewarm_workers)
+        dataset_catalog.scan()
     app.run_server(host='127.0.0.1', port='8050', debug=True)
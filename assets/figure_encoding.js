@@ -0,0 +1,104 @@
+// Decoding of figures encoded by utility/encoding.py
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    encoding: {
+        decode_figure: function(payload) {
+            // Decode base64 typed arrays of a figure payload
+            // :param payload: figure dict, possibly encoded
+            // :return: figure dict for dcc.Graph
+            if (payload === undefined || payload === null) {
+                return window.dash_clientside.no_update;
+            }
+            var meta = payload['layout'] === undefined ? undefined : payload['layout']['meta'];
+            if (meta === undefined || meta === null || !meta['encoded']) {
+                return payload;
+            }
+
+            var typed = {
+                'float32': Float32Array, 'float64': Float64Array,
+                'uint8': Uint8Array, 'uint16': Uint16Array,
+                'uint32': Uint32Array, 'int8': Int8Array,
+                'int16': Int16Array, 'int32': Int32Array, 'bool': Uint8Array
+            };
+            var decodeArray = function(encoded) {
+                var binary = atob(encoded['bdata']);
+                var bytes = new Uint8Array(binary.length);
+                for (var i = 0; i < binary.length; i++) {
+                    bytes[i] = binary.charCodeAt(i);
+                }
+                return new typed[encoded['dtype']](bytes.buffer);
+            };
+            var decodeColumn = function(encoded) {
+                var values = decodeArray(encoded);
+                var column = new Array(values.length);
+                for (var i = 0; i < values.length; i++) {
+                    if (encoded['categories'] !== undefined) {
+                        // code 0 marks missing values
+                        column[i] = values[i] === 0 ? null : encoded['categories'][values[i] - 1];
+                    } else if (encoded['dtype'] === 'bool') {
+                        column[i] = values[i] === 1;
+                    } else {
+                        column[i] = isNaN(values[i]) ? null : values[i];
+                    }
+                }
+                return column;
+            };
+
+            var fig = Object.assign({}, payload);
+            fig['data'] = payload['data'].map(function(trace) {
+                trace = Object.assign({}, trace);
+                ['x', 'y', 'z'].forEach(function(key) {
+                    if (trace[key] !== undefined && trace[key] !== null && trace[key]['bdata'] !== undefined) {
+                        trace[key] = decodeArray(trace[key]);
+                    }
+                });
+                if (trace['dimensions'] !== undefined) {
+                    trace['dimensions'] = trace['dimensions'].map(function(dimension) {
+                        if (dimension['values'] !== undefined && dimension['values']['bdata'] !== undefined) {
+                            return Object.assign({}, dimension, {'values': decodeArray(dimension['values'])});
+                        }
+                        return dimension;
+                    });
+                }
+                if (trace['marker'] !== undefined && trace['marker']['color'] !== undefined &&
+                    trace['marker']['color'] !== null && trace['marker']['color']['bdata'] !== undefined) {
+                    trace['marker'] = Object.assign({}, trace['marker'], {'color': decodeColumn(trace['marker']['color'])});
+                }
+                if (trace['customdata'] !== undefined && trace['customdata'] !== null &&
+                    trace['customdata']['columns'] !== undefined) {
+                    var columns = trace['customdata']['columns'].map(decodeColumn);
+                    var rows = new Array(columns.length ? columns[0].length : 0);
+                    for (var i = 0; i < rows.length; i++) {
+                        rows[i] = columns.map(function(column) { return column[i]; });
+                    }
+                    trace['customdata'] = rows;
+                }
+                return trace;
+            });
+            return fig;
+        },
+        apply_mask: function(mask) {
+            // Color the scatter matrix points by a bit mask of selected points
+            // :param mask: dict with base64 bits and number of points
+            // :return: empty string
+            var matrixDiv = document.getElementById('scatter_matrix');
+            if (mask === undefined || mask === null || matrixDiv === null ||
+                matrixDiv.children === undefined || matrixDiv.children.length < 2) {
+                return "";
+            }
+            var graphDiv = matrixDiv.children[1];
+            if (graphDiv.data === undefined || graphDiv.data.length === 0 ||
+                graphDiv.data[0]['dimensions'] === undefined ||
+                graphDiv.data[0]['dimensions'][0]['values'].length !== mask['size']) {
+                return "";
+            }
+            var binary = atob(mask['bits']);
+            var colors = new Uint8Array(mask['size']);
+            for (var i = 0; i < mask['size']; i++) {
+                // np.packbits() stores the first point in the highest bit
+                colors[i] = (binary.charCodeAt(i >> 3) >> (7 - (i & 7))) & 1;
+            }
+            window.Plotly.restyle(graphDiv, {'marker.color': [colors]}, [0]);
+            return "";
+        }
+    }
+});
@@ -6,11 +6,14 @@ import dash_daq as daq
 
 
 class Layout:
-    def get_layout(self, dropdowns, contigs):
+    def get_layout(self, dropdowns, contigs, rotation_path=None,
+                   session_id=None):
         """
         Builds an returns a layout
         :param contigs: list of available contigs
         :param dropdowns: Dropdown options for dataset selection
+        :param rotation_path: camera positions of the auto-rotate animation
+        :param session_id: id of the browser session
         :param scatter_test: scatterplot
         :return: dash.Layout component
         """
@@ -53,6 +56,18 @@ class Layout:
         layout = dbc.Container(fluid=True, children=[
             html.Div(id="dummy-1", hidden=True),
             html.Div(id="dummy-2", hidden=True),
+            html.Div(id="dummy-3", hidden=True),
+            dcc.Store(id="rotation-path", data=rotation_path),
+            # maps the browser tab to its state on the server
+            dcc.Store(id="session-id", data=session_id),
+            # figures as sent by the server, decoded clientside
+            dcc.Store(id="scatter3d-payload"),
+            dcc.Store(id="scatter_matrix-payload"),
+            # selection state of the scatter matrix points
+            dcc.Store(id="scatter_matrix-mask"),
+            # counter of selection changes
+            dcc.Store(id="selection-version"),
+            html.Div(id="dummy-4", hidden=True),
             dcc.Store(id="taxa_info1"),
             dcc.Store(id="taxa_info2"),
             dbc.Modal(  # startup dataset selection card
@@ -96,7 +111,23 @@ class Layout:
                             id="scatter3d",
                             config={"displayModeBar": True},
                             className="plot"
-                        )]),
+                        ),
+                        dbc.Button(
+                            html.Span(["", html.I(className="fas fa-search-plus"),
+                                       html.Span(" Full detail in view")]),
+                            color="secondary",
+                            outline=True,
+                            size="sm",
+                            id="btn-detail",
+                            className="m-2",
+                            # enabled while the plot shows a sample
+                            disabled=True
+                        ),
+                        dbc.Tooltip(
+                            "Large datasets are plotted as a sample. Load all "
+                            "genes in the current camera view.",
+                            target="btn-detail",
+                            placement="right")]),
 
                     # tabbed side menu
                     dbc.Col(width=4, children=[
@@ -114,6 +145,17 @@ class Layout:
                                                         id='dataset_select',
                                                         options=dropdowns,
                                                         placeholder="No Dataset selected"
+                                                    ),
+                                                    dbc.Button(
+                                                        html.Span(["", html.I(
+                                                            className="fas fa-sync"),
+                                                                   html.Span(
+                                                                       " Rescan datasets")]),
+                                                        color="secondary",
+                                                        outline=True,
+                                                        size="sm",
+                                                        id="btn-rescan",
+                                                        className="m-2"
                                                     )
                                                 ], className="m-2"),
                                                 dbc.Card([
@@ -401,13 +443,19 @@ class Layout:
                                               "format": Format(precision=3,
                                                                scheme=Scheme.decimal_or_exponent)}],
                                     page_size=30,
+                                    page_current=0,
                                     style_header={'textAlign': 'left'},
                                     style_table={
                                         'overflowX': 'auto',
                                         'height': 'auto'},
                                     style_cell={'textAlign': 'left'},
-                                    sort_action='native',
+                                    # rows are paged, sorted and filtered
+                                    # by the server
+                                    page_action='custom',
+                                    sort_action='custom',
                                     sort_mode='multi',
+                                    filter_action='custom',
+                                    filter_query='',
                                 ),
                             ], className="m-2"),
                         ], label="Plot Table"),
@@ -513,6 +561,14 @@ class Layout:
                                         'height': 'auto'},
                                     style_cell={'textAlign': 'left'},
                                     page_size=30,
+                                    page_current=0,
+                                    # rows are paged, sorted and filtered
+                                    # by the server
+                                    page_action='custom',
+                                    sort_action='custom',
+                                    sort_mode='multi',
+                                    filter_action='custom',
+                                    filter_query='',
                                 ),
                             ], className="d-flex m-2"),
                         ], label="Selection Table and Tools"),
@@ -0,0 +1,251 @@
+"""
+This module provides an on-disk columnar cache for the tables of a dataset.
+Tables are stored as uncompressed Feather (Arrow IPC) files in a '.cache'
+folder next to the dataset and are memory-mapped when read back.
+
+In shared mode the columns of a table are handed to pandas without copying
+them out of the memory map. The pages are then shared through the page cache
+by all processes mapping the same file, so several server workers hold about
+one copy of the data. Only columns stored without a validity bitmap can be
+shared this way, so floats keep NaN as value instead of being written as
+nulls. Strings are read as Arrow-backed pandas strings, instead of Python
+objects that every process would build on its own.
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+CACHE_DIR = ".cache"
+# bump whenever the layout of cached tables changes
+CACHE_VERSION = 4
+# pandas series keep_blocks() was checked with, shared mode relies on their
+# internals
+SHARED_PANDAS_VERSIONS = ["1.5."]
+# number of bytes hashed at the head and the tail of a source file
+SAMPLE_SIZE = 1 << 16
+
+
+def fingerprint(source_file):
+    """
+    Build a cheap fingerprint of a source file. Hashing the whole file would
+    cost as much as parsing it, so only its head and tail are hashed.
+    :param source_file: path to the source file
+    :return: dict of size, mtime and a partial hash
+    """
+    stat = os.stat(source_file)
+    digest = hashlib.sha1()
+    with open(source_file, 'rb') as f:
+        digest.update(f.read(SAMPLE_SIZE))
+        if stat.st_size > 2 * SAMPLE_SIZE:
+            f.seek(-SAMPLE_SIZE, os.SEEK_END)
+            digest.update(f.read(SAMPLE_SIZE))
+    return {'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': digest.hexdigest(),
+            'version': CACHE_VERSION}
+
+
+def cache_file(dataset_path, name, suffix=".feather"):
+    """
+    Path of a cache file of a dataset
+    :param dataset_path: path to the dataset
+    :param name: name of the cached table
+    :param suffix: file extension
+    :return: path as string
+    """
+    return os.path.join(dataset_path, CACHE_DIR, name + suffix)
+
+
+def is_valid(dataset_path, name, source_file, tag="", suffix=".feather"):
+    """
+    Check whether the cached table still matches its source file
+    :param dataset_path: path to the dataset
+    :param name: name of the cached table
+    :param source_file: file the table was built from
+    :param tag: additional key, e.g. for different load modes
+    :param suffix: file extension of the cached table
+    :return: bool
+    """
+    try:
+        with open(cache_file(dataset_path, name, ".json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    key = fingerprint(source_file)
+    key['tag'] = tag
+    return meta == key and os.path.isfile(cache_file(dataset_path, name,
+                                                     suffix))
+
+
+def load_tag(config):
+    """
+    Tag of the tables of a dataset in the load mode set in config.ini, the
+    layout of the cached tables depends on it
+    :param config: parsed config.ini
+    :return: string
+    """
+    modes = []
+    if config.getboolean('Dataframe', 'compact_dtypes', fallback=False):
+        modes.append("compact")
+    if config.getboolean('Cache', 'shared_memory', fallback=False):
+        modes.append("shared")
+    return "+".join(modes)
+
+
+def write_meta(dataset_path, name, key):
+    """
+    Record the fingerprint of the source file a cached table was built from
+    :param dataset_path: path to the dataset
+    :param name: name of the cached table
+    :param key: fingerprint() of the source file, including the tag
+    :return:
+    """
+    meta_file = cache_file(dataset_path, name, ".json")
+    tmp_file = temporary_file(meta_file)
+    with open(tmp_file, 'w') as f:
+        json.dump(key, f)
+    os.replace(tmp_file, meta_file)
+
+
+def temporary_file(target_file):
+    """
+    Temporary path to write a cache file to, unique per process since several
+    server workers may build the same cache at once
+    :param target_file: final path of the file
+    :return: path as string
+    """
+    return target_file + "." + str(os.getpid()) + ".tmp"
+
+
+def read_frame(table_file, shared=False):
+    """
+    Read a cached table through a memory map
+    :param table_file: path to the .feather file
+    :param shared: if true, columns without nulls and strings stay in the
+    memory map instead of being copied. They are read-only.
+    :return: pandas dataframe
+    """
+    with pa.memory_map(table_file) as source:
+        table = pa.ipc.open_file(source).read_all()
+    # the buffers keep the mapping alive after the file is closed
+    if not shared:
+        return table.to_pandas()
+
+    # strings stay Arrow arrays instead of becoming Python objects
+    frame = table.to_pandas(split_blocks=True, types_mapper={
+        pa.string(): pd.StringDtype("pyarrow")}.get)
+    keep_blocks(frame)
+    return frame
+
+
+def check_shared_support():
+    """
+    Refuse shared mode with a pandas version keep_blocks() wasn't checked
+    with, it would silently copy the tables into every process
+    :return:
+    """
+    if not any(pd.__version__.startswith(version)
+               for version in SHARED_PANDAS_VERSIONS):
+        raise RuntimeError("[Cache] shared_memory is not supported with "
+                           "pandas " + pd.__version__ + ", it needs pandas " +
+                           " or ".join(v + "x" for v in SHARED_PANDAS_VERSIONS))
+
+
+def keep_blocks(frame):
+    """
+    Stop pandas from consolidating the columns of a dataframe into 2D blocks.
+    Consolidation happens in place on the first take or boolean indexing and
+    would copy every column out of the memory map.
+    :param frame: pandas dataframe
+    :return:
+    """
+    # private attributes of pandas, only set with the versions allowed by
+    # check_shared_support()
+    manager = frame._mgr
+    manager._known_consolidated = True
+    manager._is_consolidated = True
+
+
+def to_table(frame, shared=False):
+    """
+    Convert a dataframe to an Arrow table for the cache
+    :param frame: pandas dataframe
+    :param shared: if true, store NaN of float columns as values, see
+    read_frame()
+    :return: pyarrow table
+    """
+    table = pa.Table.from_pandas(frame.reset_index(drop=True),
+                                 preserve_index=False)
+    if shared:
+        for i, name in enumerate(table.column_names):
+            column = frame[name]
+            if column.dtype.kind == 'f' and column.hasnans:
+                table = table.set_column(i, name, pa.array(
+                    column.to_numpy(), from_pandas=False))
+    return table
+
+
+def write_frame(frame, table_file, shared=False):
+    """
+    Write a table to the cache. The file is written to a temporary location
+    first, so readers never observe a partially written table.
+    :param frame: pandas dataframe
+    :param table_file: path to the .feather file
+    :param shared: write the layout of shared mode, see to_table()
+    :return:
+    """
+    os.makedirs(os.path.dirname(table_file), exist_ok=True)
+    tmp_file = temporary_file(table_file)
+    table = to_table(frame, shared)
+    with pa.OSFile(tmp_file, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_file, table_file)
+
+
+def load_frame(dataset_path, name, source_file, reader, tag="", enabled=True,
+               shared=False):
+    """
+    Load a table from the cache, (re)building it from its source file if the
+    cache is missing or outdated
+    :param dataset_path: path to the dataset
+    :param name: name of the cached table
+    :param source_file: file to read the table from
+    :param reader: function parsing source_file into a pandas dataframe
+    :param tag: additional key, e.g. for different load modes
+    :param enabled: if false, bypass the cache entirely
+    :param shared: read the table in shared mode, see read_frame(). A table
+    built here is read back from the cache, so that it is shared as well.
+    :return: pandas dataframe
+    """
+    if not enabled:
+        return reader(source_file)
+
+    table_file = cache_file(dataset_path, name)
+    if is_valid(dataset_path, name, source_file, tag):
+        try:
+            return read_frame(table_file, shared)
+        except (OSError, pa.ArrowException):
+            print("[WARN] Failed to read cache " + table_file)
+
+    key = fingerprint(source_file)
+    key['tag'] = tag
+    frame = reader(source_file)
+
+    try:
+        write_frame(frame, table_file, shared)
+        write_meta(dataset_path, name, key)
+    except (OSError, pa.ArrowException):
+        print("[WARN] Failed to write cache " + table_file)
+        return frame
+
+    if shared:
+        # drop the private copy in favour of the mapped one
+        try:
+            return read_frame(table_file, shared)
+        except (OSError, pa.ArrowException):
+            print("[WARN] Failed to read cache " + table_file)
+    return frame
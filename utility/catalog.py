@@ -0,0 +1,222 @@
+"""
+Catalog of the datasets found in the data folder. Every dataset gets a small
+manifest describing its files, which is built by sniffing file headers only
+and cached next to the dataset.
+"""
+import json
+import os
+from configparser import ConfigParser
+
+import pyarrow as pa
+
+from utility import cache
+
+MANIFEST = "manifest"
+# bytes read from the head of a file to sniff its header and line lengths
+SNIFF_SIZE = 1 << 16
+
+
+def sniff_file(file_path, has_header=True):
+    """
+    Read the head of a text file: column names and an estimate of the number
+    of rows extrapolated from the average line length
+    :param file_path: path to a csv / tsv file
+    :param has_header: whether the first line holds column names
+    :return: tuple of list of columns, estimated number of rows
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+
+    lines = head.split(b'\n')
+    columns = []
+    if has_header and lines:
+        columns = lines[0].decode(errors='replace').strip().split(',')
+
+    # the last line of the sample is usually cut off
+    complete = lines[:-1] if len(head) == SNIFF_SIZE else lines
+    complete = [line for line in complete if line.strip()]
+    if not complete:
+        return columns, 0
+    rows = round(size / (sum(len(line) + 1 for line in complete) / len(complete)))
+    if has_header:
+        rows -= 1
+    return columns, max(rows, 0)
+
+
+def cached_rows(dataset_path, name):
+    """
+    Number of rows of a cached table, read from the Arrow file footer
+    :param dataset_path: path to the dataset
+    :param name: name of the cached table
+    :return: number of rows
+    """
+    with pa.memory_map(cache.cache_file(dataset_path, name)) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows
+                   for i in range(reader.num_record_batches))
+
+
+def file_info(file_path):
+    """
+    Size and mtime of a file
+    :param file_path: path to the file
+    :return: dict or None if the file does not exist
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def build_manifest(dataset_path):
+    """
+    Describe a dataset without loading it
+    :param dataset_path: path to the dataset, ending with '/'
+    :return: dict
+    """
+    config = ConfigParser()
+    config.read("./static/config.ini")
+    gene_table_file = dataset_path + config['Files']['taxon_assignment']
+    hits_file = dataset_path + config['Files']['taxonomic_hits']
+    pca_path = dataset_path + "PCA_and_clustering/PCA_results/"
+
+    files = {'gene_table': file_info(gene_table_file),
+             'taxonomic_hits': file_info(hits_file),
+             'proteins': file_info(dataset_path + "proteins.faa"),
+             'pca_loadings': file_info(pca_path + "pca_loadings.csv"),
+             'pca_summary': file_info(pca_path + "pca_summary.csv"),
+             'summary': file_info(dataset_path + "gene_info/summary.txt")}
+    manifest = {'name': os.path.basename(os.path.normpath(dataset_path)),
+                'path': dataset_path,
+                'files': files}
+
+    # reuse the row counts of the previous manifest if the files are unchanged
+    previous = {}
+    try:
+        with open(cache.cache_file(dataset_path, MANIFEST, ".json")) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if previous.get('files') == files and previous.get('rows_exact'):
+        for key in ['columns', 'genes', 'hits', 'rows_exact']:
+            manifest[key] = previous[key]
+    else:
+        manifest['columns'], manifest['genes'], manifest['hits'] = [], 0, 0
+        if files['gene_table']:
+            manifest['columns'], manifest['genes'] = sniff_file(gene_table_file)
+        if files['taxonomic_hits']:
+            manifest['hits'] = sniff_file(hits_file, has_header=False)[1]
+        manifest['rows_exact'] = False
+
+    manifest['c_covs'] = [col for col in manifest['columns']
+                          if col.startswith("c_cov_")]
+    manifest['g_covs'] = [col for col in manifest['columns']
+                          if col.startswith("g_cov_")]
+
+    # cache state
+    state = {}
+    for name, source in [('gene_table', gene_table_file),
+                         ('taxonomic_hits', hits_file),
+                         ('taxonomic_hits_store', hits_file),
+                         ('proteins_index', dataset_path + "proteins.faa")]:
+        suffix = ".sqlite" if name == 'taxonomic_hits_store' else ".feather"
+        try:
+            state[name] = cache.is_valid(dataset_path, name, source,
+                                         tag=cache_tag(name, config),
+                                         suffix=suffix)
+        except OSError:
+            state[name] = False
+    manifest['cache'] = state
+
+    # exact row counts once the tables are cached
+    if not manifest['rows_exact'] and state['gene_table'] and \
+            (state['taxonomic_hits'] or not files['taxonomic_hits']):
+        manifest['genes'] = cached_rows(dataset_path, 'gene_table')
+        if files['taxonomic_hits']:
+            manifest['hits'] = cached_rows(dataset_path, 'taxonomic_hits')
+        manifest['rows_exact'] = True
+
+    try:
+        os.makedirs(os.path.join(dataset_path, cache.CACHE_DIR), exist_ok=True)
+        with open(cache.cache_file(dataset_path, MANIFEST, ".json"), 'w') as f:
+            json.dump(manifest, f)
+    except OSError:
+        print("[WARN] Failed to write manifest of " + dataset_path)
+    return manifest
+
+
+def cache_tag(name, config):
+    """
+    Tag a cached table was written with in the current load mode
+    :param name: name of the cached table
+    :param config: parsed config.ini
+    :return: string
+    """
+    if name in ['gene_table', 'taxonomic_hits']:
+        return cache.load_tag(config)
+    return ""
+
+
+def format_size(size):
+    """
+    Human-readable file size
+    :param size: size in bytes
+    :return: string
+    """
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return str(round(size, 1)) + " " + unit
+        size /= 1024
+    return str(round(size, 1)) + " TB"
+
+
+def dropdown_label(manifest):
+    """
+    Label of a dataset in the dataset selection
+    :param manifest: dict from build_manifest()
+    :return: string
+    """
+    approx = "" if manifest['rows_exact'] else "~"
+    size = sum(info['size'] for info in manifest['files'].values() if info)
+    ready = "cached" if manifest['cache']['gene_table'] else "not cached"
+    return manifest['name'] + " (" + approx + "{:,}".format(manifest['genes']) \
+        + " genes, " + format_size(size) + ", " + ready + ")"
+
+
+class DatasetCatalog:
+    """
+    Datasets below a base folder, rescanned on demand
+    """
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.manifests = {}
+
+    def scan(self):
+        """
+        Look for datasets and refresh their manifests
+        :return: list of manifests
+        """
+        manifests = {}
+        for file in sorted(os.listdir(self.base_path)):
+            d = os.path.join(self.base_path, file)
+            if os.path.isdir(d):
+                manifests[d + "/"] = build_manifest(d + "/")
+        self.manifests = manifests
+        return list(manifests.values())
+
+    def paths(self):
+        """
+        Paths of all known datasets
+        :return: list of strings
+        """
+        return list(self.manifests.keys())
+
+    def dropdowns(self):
+        """
+        Options for the dataset selection
+        :return: list of dicts
+        """
+        return [{'label': dropdown_label(manifest), 'value': path}
+                for path, manifest in self.manifests.items()]
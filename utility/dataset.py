@@ -1,64 +1,259 @@
 import json
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from configparser import ConfigParser
+from utility import cache
+from utility import hits_store
 from utility import required_functionalities as rf
+from utility.locking import ReadWriteLock
+
+# returned by DataSet.get_taxonomic_hits() while the hits are being loaded
+HITS_LOADING = "loading"
+
+# manually assert datatypes to save computing time
+TAXONOMIC_HITS_DTYPES = {'qseqid': str, 'sseqid': str, 'pident': float,
+                         'length': int, 'mismatch': int,
+                         'gapopen': int, 'qstart': int, 'qend': int,
+                         'sstart': int, 'send': int, 'evalue': float,
+                         'bitscore': float, 'staxids': str,
+                         'sscinames': str}
+
+
+def pandas_read_options(cols):
+    """
+    Options of pd.read_csv() for taxonomic_hits.txt
+    :param cols: column names
+    :return: dict of keyword arguments
+    """
+    return dict(header=None,
+                encoding='unicode_escape',
+                sep='\t',
+                names=cols,
+                dtype={col: TAXONOMIC_HITS_DTYPES[col] for col in cols
+                       if col in TAXONOMIC_HITS_DTYPES},
+                skip_blank_lines=True)
+
+
+def read_taxonomic_hits(source_file, cols, engine="arrow"):
+    """
+    Parse taxonomic_hits.txt and log the ingest throughput. The arrow engine
+    parses blocks of the file on all cores, if it fails the file is read by
+    pandas instead.
+    :param source_file: path to taxonomic_hits.txt
+    :param cols: column names
+    :param engine: 'arrow' or 'pandas'
+    :return: pandas dataframe
+    """
+    start = time.perf_counter()
+    taxonomic_hits = None
+
+    if engine == "arrow":
+        arrow_types = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+        try:
+            table = pa_csv.read_csv(
+                source_file,
+                read_options=pa_csv.ReadOptions(column_names=cols,
+                                                use_threads=True),
+                parse_options=pa_csv.ParseOptions(delimiter='\t'),
+                convert_options=pa_csv.ConvertOptions(
+                    strings_can_be_null=True,
+                    column_types={col: arrow_types[TAXONOMIC_HITS_DTYPES[col]]
+                                  for col in cols
+                                  if col in TAXONOMIC_HITS_DTYPES}))
+            taxonomic_hits = table.to_pandas()
+        except pa.ArrowInvalid as e:
+            print("[WARN] Arrow failed to parse " + source_file +
+                  ", falling back to pandas: " + str(e))
+            engine = "pandas"
+
+    if taxonomic_hits is None:
+        taxonomic_hits = pd.read_csv(source_file, **pandas_read_options(cols))
+
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(source_file) / 1024 ** 2
+    print("[INFO] Read " + source_file + " with " + engine + ": " +
+          str(round(size, 1)) + " MB in " + str(round(seconds, 2)) + " s (" +
+          str(round(size / max(seconds, 1e-9), 1)) + " MB/s)")
+    return taxonomic_hits
+
+
+def add_first_hit_columns(taxonomic_hits):
+    """
+    Add the first of the ';' separated names / taxids as columns, only these
+    are displayed
+    :param taxonomic_hits: pandas dataframe as read from taxonomic_hits.txt
+    :return: pandas dataframe
+    """
+    return taxonomic_hits.assign(
+        first_sscinames=taxonomic_hits['sscinames'].str.split(';', n=1).str[0],
+        first_staxids=taxonomic_hits['staxids'].str.split(';', n=1).str[0])
+
+
+def prepare_taxonomic_hits(taxonomic_hits):
+    """
+    Stable sort of the taxonomic hits by qseqid, such that all hits of a
+    query form a contiguous block. Hits keep their order within a block.
+    Also adds the first of the ';' separated names / taxids as columns.
+    :param taxonomic_hits: pandas dataframe as read from taxonomic_hits.txt
+    :return: sorted pandas dataframe
+    """
+    taxonomic_hits = taxonomic_hits.dropna(subset=['qseqid'])
+    taxonomic_hits = taxonomic_hits.sort_values('qseqid', kind='mergesort')
+    taxonomic_hits = taxonomic_hits.reset_index(drop=True)
+    return add_first_hit_columns(taxonomic_hits)
+
+
+def format_taxonomic_hits(taxonomic_hits):
+    """
+    Prepare hits for display: only the first name/id and truncated e-values
+    :param taxonomic_hits: pandas dataframe with first_* columns
+    :return: new pandas dataframe
+    """
+    display_cols = [col for col in taxonomic_hits.columns
+                    if col not in ['first_sscinames', 'first_staxids']]
+
+    # assign() returns a proper copy (avoid SettingWithCopyWarning)
+    staxids = taxonomic_hits['first_staxids'].astype(object)
+    return taxonomic_hits[display_cols].assign(
+        evalue=np.char.mod('%.3g', taxonomic_hits['evalue'].to_numpy()),
+        sscinames=taxonomic_hits['first_sscinames'],
+        staxids=staxids.where(staxids.notna(), None))
+
+
+def compact_gene_table(gene_table):
+    """
+    Shrink the gene table: categorical labels, float32 coordinates and
+    coverages. e-values stay float64, they exceed the range of float32.
+    :param gene_table: pandas dataframe as read from the gene table
+    :return: pandas dataframe
+    """
+    for col in ['c_name', 'plot_label', 'taxon_assignment']:
+        if col in gene_table.columns:
+            gene_table[col] = gene_table[col].astype('category')
+
+    float32_max = np.finfo(np.float32).max
+    for col in gene_table.columns:
+        if not (col.startswith('Dim.') or 'cov' in col):
+            continue
+        if not pd.api.types.is_float_dtype(gene_table[col]):
+            continue
+        # keep float64 where values would overflow
+        if gene_table[col].abs().max() < float32_max:
+            gene_table[col] = gene_table[col].astype(np.float32)
+    return gene_table
+
+
+def compact_taxonomic_hits(taxonomic_hits):
+    """
+    Shrink the taxonomic hits: categorical ids and names, integer taxids and
+    the smallest integer type for alignment coordinates. pident and bitscore
+    stay float64, float32 would show e.g. 99.1 as 99.099998.
+    :param taxonomic_hits: pandas dataframe from prepare_taxonomic_hits()
+    :return: pandas dataframe
+    """
+    for col in ['qseqid', 'sscinames', 'staxids', 'first_sscinames']:
+        taxonomic_hits[col] = taxonomic_hits[col].astype('category')
+
+    taxonomic_hits['first_staxids'] = pd.to_numeric(
+        taxonomic_hits['first_staxids'], errors='coerce').astype('Int32')
+
+    for col in ['length', 'mismatch', 'gapopen', 'qstart', 'qend', 'sstart',
+                'send']:
+        if pd.api.types.is_integer_dtype(taxonomic_hits[col]):
+            taxonomic_hits[col] = pd.to_numeric(taxonomic_hits[col],
+                                                downcast='integer')
+    return taxonomic_hits
+
+
+def mapped_bytes(data):
+    """
+    Size of the columns of a dataframe that are read-only views, i.e. stay in
+    the memory map of the cache, see cache.read_frame()
+    :param data: pandas dataframe
+    :return: size in bytes
+    """
+    size = 0
+    for col in data.columns:
+        column = data[col]
+        if getattr(column.dtype, 'storage', None) == "pyarrow":
+            # Arrow strings, see cache.read_frame()
+            size += column.array.nbytes
+            continue
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.array.codes
+        else:
+            # no copy for numpy dtypes
+            values = column.to_numpy()
+        if not values.flags.writeable:
+            size += values.nbytes
+    return size
 
 
 class DataSet:
     """
-    Represents a loaded dataset and supports selection
+    Represents a loaded dataset. It is shared read-only between sessions,
+    selections are passed in by the sessions owning them.
     """
     def __init__(self, path=None):
         # config file
         config = ConfigParser()
         config.read("./static/config.ini")
 
-        # column names according to the diamond documentation
-        taxonomic_hits_cols = config['Dataframe']['taxonomic_hits_cols']
-        taxonomic_hits_cols = taxonomic_hits_cols.split(",")
-        # manually assert datatypes to save computing time
-        taxonomic_hits_dtypes = {'qseqid': str, 'sseqid': str, 'pident': float,
-                                 'lenght': int, 'mismatch': int,
-                                 'gapopen': int, 'qstart': int, 'gend': int,
-                                 'sstart': int, 'send': int, 'evalue': float,
-                                 'bitscore': float, 'staxids': str,
-                                 'sscinames': str}
+        # taxonomic hits are loaded in the background
+        self.taxonomic_hits = None
+        self.hit_keys = None
+        self.hit_categories = None
+        # out-of-core backend for very large hit tables
+        self.hit_store = None
+        self.hits_loaded = threading.Event()
+        # the hits are published by the loader thread while callbacks read
+        # them, readers must see the table and its keys of the same state
+        self.lock = ReadWriteLock()
+
+        # categorical and 32 bit dtypes to save memory
+        self.compact = config.getboolean('Dataframe', 'compact_dtypes',
+                                         fallback=False)
+        # tables stay in the memory-mapped cache, shared by all processes
+        self.shared = config.getboolean('Cache', 'shared_memory',
+                                        fallback=False)
+        if self.shared:
+            cache.check_shared_support()
+        # cache tag of the load mode
+        self.cache_tag = cache.load_tag(config)
 
         # read data
         if path:
             main_file = config['Files']['taxon_assignment']
-            taxonomic_hits_file = config['Files']['taxonomic_hits']
-            self.original_data = pd.read_csv(path + main_file)
-
-            # fetch taxonomic hits, this may take a while
-            try:
-                self.taxonomic_hits = pd.read_csv(path + taxonomic_hits_file,
-                                                  header=None,
-                                                  encoding='unicode_escape',
-                                                  sep='\t',
-                                                  names=taxonomic_hits_cols,
-                                                  dtype=taxonomic_hits_dtypes,
-                                                  skip_blank_lines=True)
-            except ValueError:
-                self.taxonomic_hits = None
-                print("[WARN] Failed to read taxonomic_hits.txt")
-
+            # columnar cache next to the dataset
+            use_cache = config.getboolean('Cache', 'enabled', fallback=True)
+            if self.compact:
+                reader = lambda f: compact_gene_table(pd.read_csv(f))
+            else:
+                reader = pd.read_csv
+            self.original_data = cache.load_frame(path, "gene_table",
+                                                  path + main_file, reader,
+                                                  tag=self.cache_tag,
+                                                  enabled=use_cache,
+                                                  shared=self.shared)
         else:
             # emtpy data for taxonomic_hits
-            self.taxonomic_hits = None
+            self.hits_loaded.set()
             # emtpy standard dataframe
             base_cols = config['Dataframe']['base_cols'].split(",")
             self.original_data = pd.DataFrame(data=[], columns=base_cols)
 
-        # init selection keys
-        self.selection_keys = set()
-
         # coverage variables
         self.c_covs, self.g_covs = self.filter_cov_variables()
 
         # contigs
-        self.contigs = self.original_data['c_name'].unique()
+        self.contigs = np.asarray(self.original_data['c_name'].unique())
 
         # gene names
         if not self.original_data.empty:
@@ -66,6 +261,189 @@ class DataSet:
         else:
             self.gene_names = []
 
+        # 'protID' was renamed to 'fasta_header' in taXanimer commit a424195
+        if 'protID' in self.original_data.columns:
+            # preserve backwards compatibility
+            self.header_name = 'protID'
+        else:
+            self.header_name = 'fasta_header'
+
+        # size of the gene table columns in the memory map, to detect copies
+        self.mapped_gene_table = mapped_bytes(self.original_data) \
+            if self.shared else 0
+
+        # hash indices from g_name / fasta_header to row position
+        self.gene_index = pd.Index(self.original_data['g_name'])
+        self.header_index = pd.Index(self.original_data[self.header_name])
+
+        # memory footprint, computed on demand
+        self.memory_stats = None
+
+        # memoized results of get_plot_data() with their size in bytes,
+        # least recently used first
+        self.plot_cache = OrderedDict()
+        self.plot_cache_bytes = 0
+        self.plot_cache_lock = threading.Lock()
+        self.plot_cache_size = config.getint('Cache', 'plot_data_entries',
+                                             fallback=8)
+
+        # fetch taxonomic hits, this may take a while
+        if path:
+            threading.Thread(target=self.load_taxonomic_hits,
+                             args=(path, config), daemon=True).start()
+
+    def load_taxonomic_hits(self, path, config):
+        """
+        Read taxonomic_hits.txt. This is meant to run in a background thread,
+        get_taxonomic_hits() reports HITS_LOADING until it has finished.
+        :param path: path to the dataset
+        :param config: parsed config.ini
+        :return:
+        """
+        # column names according to the diamond documentation
+        taxonomic_hits_cols = config['Dataframe']['taxonomic_hits_cols']
+        taxonomic_hits_cols = taxonomic_hits_cols.split(",")
+        engine = config.get('Hits', 'reader', fallback='arrow')
+
+        def reader(f):
+            taxonomic_hits = prepare_taxonomic_hits(
+                read_taxonomic_hits(f, taxonomic_hits_cols, engine))
+            # shared mode looks hits up by category codes, string keys
+            # would be copied into an object array in every process
+            if self.compact or self.shared:
+                taxonomic_hits = compact_taxonomic_hits(taxonomic_hits)
+            return taxonomic_hits
+
+        def chunks():
+            chunk_rows = config.getint('Hits', 'chunk_rows', fallback=500000)
+            for chunk in pd.read_csv(source_file, chunksize=chunk_rows,
+                                     **pandas_read_options(taxonomic_hits_cols)):
+                yield add_first_hit_columns(chunk.dropna(subset=['qseqid']))
+
+        source_file = path + config['Files']['taxonomic_hits']
+        use_cache = config.getboolean('Cache', 'enabled', fallback=True)
+        try:
+            if self.use_hit_store(source_file, config):
+                self.set_hit_store(hits_store.open_store(path, source_file,
+                                                         chunks))
+            else:
+                try:
+                    taxonomic_hits = cache.load_frame(
+                        path, "taxonomic_hits", source_file, reader,
+                        tag=self.cache_tag, enabled=use_cache,
+                        shared=self.shared)
+                except MemoryError:
+                    print("[WARN] taxonomic_hits.txt does not fit into "
+                          "memory, using the SQLite backend")
+                    self.set_hit_store(hits_store.open_store(
+                        path, source_file, chunks))
+                else:
+                    self.set_taxonomic_hits(taxonomic_hits)
+        except ValueError:
+            print("[WARN] Failed to read taxonomic_hits.txt")
+        finally:
+            self.hits_loaded.set()
+
+        report = self.memory_report()
+        print("[INFO] Memory usage of " + path + ": " +
+              ", ".join(key + " " + str(round(value / 1024 ** 2, 1)) + " MB"
+                        for key, value in report.items()))
+
+    def set_taxonomic_hits(self, taxonomic_hits):
+        """
+        Publish an in-memory hits table and its lookup keys
+        :param taxonomic_hits: pandas dataframe from prepare_taxonomic_hits()
+        :return:
+        """
+        # hits are sorted by qseqid, lookups are binary searches on keys
+        qseqid = taxonomic_hits['qseqid']
+        hit_categories = None
+        if isinstance(qseqid.dtype, pd.CategoricalDtype):
+            # sorted categories, hence the codes are sorted as well
+            hit_categories = qseqid.cat.categories
+            hit_keys = qseqid.cat.codes.to_numpy()
+        else:
+            hit_keys = qseqid.to_numpy()
+        with self.lock.write():
+            self.hit_categories = hit_categories
+            self.hit_keys = hit_keys
+            self.taxonomic_hits = taxonomic_hits
+
+    def set_hit_store(self, hit_store):
+        """
+        Publish the out-of-core hits backend
+        :param hit_store: SQLiteHitStore
+        :return:
+        """
+        with self.lock.write():
+            self.hit_store = hit_store
+
+    @staticmethod
+    def use_hit_store(source_file, config):
+        """
+        Decide whether the hits go to the out-of-core SQLite backend
+        :param source_file: path to taxonomic_hits.txt
+        :param config: parsed config.ini
+        :return: bool
+        """
+        backend = config.get('Hits', 'backend', fallback='memory')
+        if backend == 'auto':
+            threshold = config.getint('Hits', 'sqlite_threshold_mb',
+                                      fallback=2048)
+            return os.path.getsize(source_file) > threshold * 1024 ** 2
+        return backend == 'sqlite'
+
+    def wait_for_hits(self, timeout=None):
+        """
+        Block until the taxonomic hits have been loaded
+        :param timeout: maximum time to wait in seconds, None waits forever
+        :return: True if loading has finished
+        """
+        return self.hits_loaded.wait(timeout)
+
+    def memory_report(self):
+        """
+        Memory footprint of the loaded tables. Columns in the memory-mapped
+        cache are reported as 'mapped' and not counted in the tables or the
+        total, as they are shared with other processes. The tables memoized
+        by get_plot_data() are reported as 'plot_data'. The sizes of the
+        loaded tables are memoized once the taxonomic hits have finished
+        loading.
+        :return: dict of sizes in bytes per table and in total
+        """
+        if self.memory_stats is not None:
+            tables, mapped = self.memory_stats
+        else:
+            hits_loaded = self.hits_loaded.is_set()
+            tables = {}
+            mapped = 0
+            for name, table in {'gene_table': self.original_data,
+                                'taxonomic_hits': self.taxonomic_hits}.items():
+                if table is None:
+                    continue
+                table_mapped = mapped_bytes(table)
+                tables[name] = int(table.memory_usage(deep=True).sum()) - \
+                    table_mapped
+                mapped += table_mapped
+            if hits_loaded:
+                self.memory_stats = tables, mapped
+
+        report = dict(tables)
+        with self.plot_cache_lock:
+            if self.plot_cache_bytes:
+                report['plot_data'] = self.plot_cache_bytes
+        report['total'] = sum(report.values())
+        if mapped:
+            report['mapped'] = mapped
+        return report
+
+    def memory_usage(self):
+        """
+        Total memory footprint of the loaded tables
+        :return: size in bytes
+        """
+        return self.memory_report()['total']
+
     def get_data_original(self):
         """
         Returns the unmodified dataframe as read from the .csv file on init
@@ -90,156 +468,220 @@ class DataSet:
 
     def get_plot_data(self, filters, color_root=None):
         """
-        Builds a modified dataframe to be fed to plotly
+        Builds a modified dataframe to be fed to plotly. Results are memoized
+        per filter state, callers must not modify the returned dataframe.
         :param filters: current filters
         :param color_root a color hex string, which define the pole label color.
         :return: a modified dataframe
         """
-        original_data = self.original_data
         e_value = filters.get('e-value')
+        contigs = filters.get('contigs')
+        # on startup contigs will be none
+        contig_key = frozenset(contigs) if contigs is not None else None
+        key = (e_value, contig_key, color_root)
+
+        with self.plot_cache_lock:
+            if key in self.plot_cache:
+                self.plot_cache.move_to_end(key)
+                return self.plot_cache[key][0]
+
+        # filler, contigs may be a numpy array
+        if contigs is not None and len(contigs) == 0:
+            plot_data = self.get_empty_colored()
+        else:
+            plot_data = self.build_plot_data(e_value, contigs, color_root)
+
+        if self.mapped_gene_table:
+            self.check_mapped()
+
+        size = int(plot_data.memory_usage(deep=True).sum())
+        with self.plot_cache_lock:
+            if key in self.plot_cache:
+                self.plot_cache_bytes -= self.plot_cache[key][1]
+            self.plot_cache[key] = plot_data, size
+            self.plot_cache_bytes += size
+            while len(self.plot_cache) > self.plot_cache_size:
+                _, (_, old_size) = self.plot_cache.popitem(last=False)
+                self.plot_cache_bytes -= old_size
+        return plot_data
+
+    def check_mapped(self):
+        """
+        Warn if the gene table was copied out of the memory map, e.g. by a
+        pandas version consolidating the columns despite cache.keep_blocks()
+        :return:
+        """
+        mapped = mapped_bytes(self.original_data)
+        if mapped < self.mapped_gene_table:
+            print("[WARN] Gene table was copied out of the shared cache (" +
+                  str(round((self.mapped_gene_table - mapped) / 1024 ** 2, 1)) +
+                  " MB), pandas " + pd.__version__ + " may be unsupported")
+            # warn only once
+            self.mapped_gene_table = mapped
+
+    def build_plot_data(self, e_value, contigs, color_root=None):
+        """
+        Filter the dataset and add the synthetic color and label columns
+        :param e_value: e-value threshold
+        :param contigs: contigs to keep, None keeps all
+        :param color_root a color hex string, which define the pole label color.
+        :return: a modified dataframe, indexed like original_data
+        """
+        original_data = self.original_data
         plot_data = original_data[original_data.bh_evalue < e_value]
 
         # contig filter
-        contigs = filters.get('contigs')
-
-        # on startup contigs will be none
         if contigs is not None:
             plot_data = plot_data[plot_data['c_name'].isin(contigs)]
 
-        # add
-        # color legend
-        color_data = pd.DataFrame({'plot_label': plot_data['plot_label'].unique(),
-                                   'taxa_color': rf.qualitativeColours(
-                                       len(plot_data['plot_label'].unique()), color_root)
-                                   })
-
-        # merge using plot label as key
-        plot_data = plot_data.merge(color_data,
-                                    left_on='plot_label',
-                                    right_on='plot_label')
+        # color legend, labels may be categorical in compact mode
+        labels = plot_data['plot_label'].astype(object)
+        unique_labels = labels.unique()
+        colors = rf.qualitativeColours(len(unique_labels), color_root)
+        color_map = pd.Series(colors, index=unique_labels, dtype=object)
 
         # modify plot label to show appearance data
-        taxon_counts = dict(plot_data['plot_label'].value_counts())
-        for index, row in plot_data.iterrows():
-            new_label = row['plot_label'] + " (" + str(taxon_counts.get(row['plot_label'])) + ")"
-            plot_data.at[index, 'plot_label_v'] = new_label
+        taxon_counts = labels.value_counts()
+        return plot_data.assign(
+            taxa_color=labels.map(color_map),
+            plot_label_v=labels + " (" + labels.map(taxon_counts).astype(str) + ")")
 
-        # filler
-        if contigs == []:
-            plot_data = self.get_empty_colored()
-        return plot_data
-
-    def selected_merge(self, data=None):
+    def selected_merge(self, selection, data=None):
         """
          Get a pandas dataframe of currently 'selected' column.
+        :param selection: Selection of rows, owned by a session
         :param data: A pandas dataframe to use.
         :return: Complete and supplemented  pandas dataframe.
         """
         if data is None:
             data = self.original_data
+        return selection.merge(data)
 
-        if len(self.selection_keys) == 0:
-            return data.assign(selected=False)
-
-        if len(self.selection_keys) == len(data.index):
-            return data.assign(selected=True)
-
-        return (data[~data['g_name'].isin(self.selection_keys)].assign(selected=False)).append(
-            data[data['g_name'].isin(self.selection_keys)].assign(selected=True))
-
-    def get_selected_data(self, data=None):
+    def get_selected_data(self, selection, data=None):
         """
         Get a pandas dataframe of currently selected rows
+        :param selection: Selection of rows, owned by a session
         :param data: A pandas dataframe to use.
         :return: Filtered pandas dataframe.
         """
         if data is None:
             data = self.original_data
+        return selection.selected(data)
 
-        if len(self.selection_keys) == 0:
-            cols = data.columns
-            empty_frame = pd.DataFrame(columns=cols)
-            return empty_frame
-        # select by keys
-        return data[data['g_name'].isin(self.selection_keys)]
-
-    def get_unselected_data(self, data=None):
+    def get_unselected_data(self, selection, data=None):
         """
         Get a pandas dataframe of currently not selected rows.
+        :param selection: Selection of rows, owned by a session
         :param data: A pandas dataframe to use.
         :return: Filtered pandas dataframe.
         """
         if data is None:
             data = self.original_data
+        return selection.unselected(data)
 
-        if len(self.selection_keys) == 0:
-            return data
-        # select by keys
-        return data[~data['g_name'].isin(self.selection_keys)]
+    def get_selected_keys(self, selection):
+        """
+        Get the g_names of all selected rows
+        :param selection: Selection of rows, owned by a session
+        :return: list of g_names
+        """
+        return self.original_data['g_name'].to_numpy()[selection.rows()].tolist()
 
-    def select(self, key):
+    def get_selected_fasta_headers(self, selection):
         """
-        Add a key to the selection
-        :param key: the g_name
-        :return:
+        Get the fasta_headers of all selected rows
+        :param selection: Selection of rows, owned by a session
+        :return: list of fasta_headers
         """
-        self.selection_keys.add(key)
+        headers = self.original_data[self.header_name].to_numpy()
+        return headers[selection.rows()].tolist()
 
-    def unselect(self, key):
+    def get_rows(self, keys):
         """
-        Remove a key from the selection
-        :param key: th g_name
-        :return:
+        Translate g_names into row positions, unknown keys are skipped
+        :param keys: iterable of g_names
+        :return: numpy array of row positions
         """
-        try:
-            self.selection_keys.remove(key)
-        except KeyError:
-            print("Can't unselect a not selected element: " + key)
+        rows = self.gene_index.get_indexer_for(list(keys))
+        return rows[rows >= 0]
 
-    def reset_selection(self):
+    def get_row(self, key, index=None):
         """
-        Dump all keys
-        :return:
+        Find the row position of a single key
+        :param key: g_name or fasta_header
+        :param index: index to search, defaults to the g_name index
+        :return: row position or None
         """
-        self.selection_keys = set()
+        if index is None:
+            index = self.gene_index
+        rows = index.get_indexer_for([key])
+        if len(rows) == 0 or rows[0] < 0:
+            return None
+        return rows[0]
+
+    def get_gene_data(self, gene_name):
+        """
+        Fetch the row of a gene
+        :param gene_name: value of col g_name
+        :return: pandas series or None
+        """
+        row = self.get_row(gene_name)
+        if row is None:
+            return None
+        return self.original_data.iloc[row]
+
+    def get_gene_name(self, fasta_header):
+        """
+        Fetch the g_name associated with a given fasta_header
+        :param fasta_header: value of col fasta_header
+        :return: g_name or None
+        """
+        row = self.get_row(fasta_header, self.header_index)
+        if row is None:
+            return None
+        return self.original_data['g_name'].iat[row]
 
     def get_fasta_header(self, gene_name):
         """
         Fetch the fasta_header identifier associated with a given g_name
         :param gene_name: value of col gene_name from dataframe
-        :return:
+        :return: fasta_header or None
         """
-        original_data = self.original_data
-
-        # 'protID' was renamed to 'fasta_header' in taXanimer commit a424195
-        if 'protID' in original_data.columns:
-            # preserve backwards compatibility
-            my_id = original_data.loc[original_data['g_name'] == gene_name]['protID'].item()
-        else:
-            my_id = original_data.loc[original_data['g_name'] == gene_name]['fasta_header'].item()
-        return my_id
+        row = self.get_row(gene_name)
+        if row is None:
+            return None
+        return self.original_data[self.header_name].iat[row]
 
     def get_taxonomic_hits(self, fasta_header):
         """
         Fetch rows from taxonomic_hits.txt matching the fasta_header
         :param fasta_header: fasta_header observed
-        :return: pandas dataframe
+        :return: pandas dataframe, HITS_LOADING while still loading
         """
-        taxonomic_hits = self.taxonomic_hits
-        if taxonomic_hits is None:
+        if not self.hits_loaded.is_set():
+            return HITS_LOADING
+
+        # the lookup works on a consistent snapshot, outside of the lock
+        with self.lock.read():
+            taxonomic_hits = self.taxonomic_hits
+            hit_keys = self.hit_keys
+            hit_categories = self.hit_categories
+            hit_store = self.hit_store
+
+        if hit_store is not None:
+            return format_taxonomic_hits(hit_store.lookup(fasta_header))
+        elif taxonomic_hits is None:
             return None
         else:
-            # return a proper copy (avoid SettingWithCopyWarning)
-            my_rows = taxonomic_hits[taxonomic_hits['qseqid'] == fasta_header].copy(deep=True)
-
-            # show only the first hit
-            for index, row in my_rows.iterrows():
-                # truncate e-value
-                my_rows.at[index, 'evalue'] = '{:.3g}'.format(row['evalue'])
-                # only return the first name/id
-                my_rows.at[index, 'sscinames'] = str(row['sscinames']).split(';')[0]
-                my_rows.at[index, 'staxids'] = str(row['staxids']).split(';')[0]
-            return my_rows
+            key = fasta_header
+            # compact mode searches the category codes, -1 matches no row
+            if hit_categories is not None:
+                key = hit_categories.get_indexer([fasta_header])[0]
+
+            # all hits of a query form a contiguous block of the sorted table
+            start = np.searchsorted(hit_keys, key, side='left')
+            end = np.searchsorted(hit_keys, key, side='right')
+            return format_taxonomic_hits(taxonomic_hits.iloc[start:end])
 
     def get_selectable_variables(self, table_format=True):
         """
@@ -292,11 +734,12 @@ class DataSet:
 
         return clean_name, number_str
 
-    def export_csv(self, cols, path):
+    def export_csv(self, selection, cols, path):
         """
         Export the selection table to .csv
+        :param selection: Selection of rows, owned by a session
         :param cols:
-        :param selection_keys:
+        :param path:
         :return:
         """
         original_data = self.original_data
@@ -308,7 +751,7 @@ class DataSet:
         # filter cols
         data = original_data[original_data.columns.intersection(cols)]
         # filter rows
-        data = data[data['g_name'].isin(list(self.selection_keys))]
+        data = selection.selected(data)
 
         # export .csv
         data.to_csv(path + '/selection.csv', index=False)
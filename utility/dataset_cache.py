@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import OrderedDict
+from configparser import ConfigParser
+
+from utility import dataset as ds
+
+
+def source_key(path):
+    """
+    Build a cache key from a dataset path and the mtimes of its source files
+    :param path: path to the dataset
+    :return: tuple
+    """
+    config = ConfigParser()
+    config.read("./static/config.ini")
+
+    mtimes = []
+    for file in [config['Files']['taxon_assignment'],
+                 config['Files']['taxonomic_hits']]:
+        try:
+            mtimes.append(os.stat(path + file).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return (path, *mtimes)
+
+
+class DataSetCache:
+    """
+    Bounded LRU cache of loaded DataSet instances. Entries are evicted by
+    their memory footprint rather than by their number.
+    """
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            config = ConfigParser()
+            config.read("./static/config.ini")
+            max_bytes = config.getint('Cache', 'max_datasets_mb',
+                                      fallback=4096) * 1024 ** 2
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # locks of datasets being loaded, by path
+        self.loading = {}
+
+    def get(self, path):
+        """
+        Fetch a dataset, loading it if it is not cached or outdated
+        :param path: path to the dataset
+        :return: DataSet
+        """
+        key = source_key(path)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                # memoized plot tables grow the datasets after loading
+                self.evict()
+                return self.entries[key]
+            loading = self.loading.setdefault(path, threading.Lock())
+
+        # load outside of the cache lock, parsing may take a while. Concurrent
+        # requests for the same dataset wait for this load instead of
+        # starting their own.
+        with loading:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    return self.entries[key]
+
+            dataset = ds.DataSet(path)
+
+            # the new version replaces outdated ones in a single step
+            with self.lock:
+                for old_key in [k for k in self.entries if k[0] == path]:
+                    del self.entries[old_key]
+                self.entries[key] = dataset
+                self.evict()
+                self.loading.pop(path, None)
+
+        # the taxonomic hits are still loading and not counted yet
+        threading.Thread(target=self.evict_when_loaded, args=(dataset,),
+                         daemon=True).start()
+        return dataset
+
+    def evict_when_loaded(self, dataset):
+        """
+        Check the memory budget again once a dataset has loaded its
+        taxonomic hits
+        :param dataset: DataSet
+        :return:
+        """
+        dataset.wait_for_hits()
+        with self.lock:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used datasets until the cache fits into
+        max_bytes. The most recent dataset is always kept.
+        :return:
+        """
+        while len(self.entries) > 1 and self.memory_usage() > self.max_bytes:
+            key, _ = self.entries.popitem(last=False)
+            print("[INFO] Evicted dataset " + str(key[0]) + " from cache")
+
+    def memory_usage(self):
+        """
+        Total memory footprint of all cached datasets
+        :return: size in bytes
+        """
+        return sum(dataset.memory_usage() for dataset in self.entries.values())
+
+    def clear(self):
+        """
+        Drop all cached datasets
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,179 @@
+"""
+Compact encoding of figure payloads. Coordinates are sent as base64 float32
+arrays, integer columns in their smallest integer type and other customdata
+columns as base64 integer codes into a list of categories, instead of JSON
+lists. The figures are decoded in the browser by
+assets/figure_encoding.js.
+"""
+import base64
+import json
+from configparser import ConfigParser
+
+import numpy as np
+import pandas as pd
+import plotly
+
+# trace attributes holding coordinates
+COORDINATE_KEYS = ['x', 'y', 'z']
+
+
+def encode_array(values, dtype):
+    """
+    Encode an array as base64 typed array
+    :param values: array-like
+    :param dtype: numpy dtype of the typed array
+    :return: dict with dtype and base64 data
+    """
+    values = np.ascontiguousarray(values, dtype=dtype)
+    return {'dtype': values.dtype.name,
+            'bdata': base64.b64encode(values.tobytes()).decode()}
+
+
+def code_dtype(size):
+    """
+    Smallest unsigned integer type for codes into a list of categories
+    :param size: number of categories
+    :return: numpy dtype
+    """
+    if size < 1 << 8:
+        return np.uint8
+    if size < 1 << 16:
+        return np.uint16
+    return np.uint32
+
+
+def integer_dtype(column):
+    """
+    Smallest integer type for the values of an integer column
+    :param column: pandas series of integers without missing values
+    :return: numpy dtype, None if the values don't fit into 32 bits
+    """
+    if column.empty:
+        return np.uint8
+    low, high = int(column.min()), int(column.max())
+    if low >= 0:
+        return code_dtype(high + 1) if high < 1 << 32 else None
+    for dtype in [np.int8, np.int16, np.int32]:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+
+def encode_column(values):
+    """
+    Encode a customdata or color column. Integers are stored in the smallest
+    integer type, other numbers are kept as float64 (e-values don't fit into
+    float32), everything else is stored as codes into its unique values, with
+    0 marking missing values.
+    :param values: array-like
+    :return: dict
+    """
+    column = pd.Series(values).infer_objects()
+    if pd.api.types.is_bool_dtype(column):
+        encoded = encode_array(column, np.uint8)
+        encoded['dtype'] = 'bool'
+        return encoded
+    if pd.api.types.is_integer_dtype(column) and not column.hasnans:
+        dtype = integer_dtype(column)
+        if dtype is not None:
+            return encode_array(column, dtype)
+    if pd.api.types.is_numeric_dtype(column):
+        return encode_array(column, np.float64)
+
+    codes, categories = pd.factorize(column)
+    encoded = encode_array(codes + 1, code_dtype(len(categories) + 1))
+    encoded['categories'] = categories.tolist()
+    return encoded
+
+
+def encode_customdata(customdata):
+    """
+    Encode a customdata matrix column by column
+    :param customdata: 2D array of rows
+    :return: dict with list of encoded columns
+    """
+    customdata = np.asarray(customdata, dtype=object)
+    if customdata.ndim != 2:
+        return customdata.tolist()
+    return {'columns': [encode_column(customdata[:, i])
+                        for i in range(customdata.shape[1])]}
+
+
+def encode_trace(trace):
+    """
+    Encode the data arrays of a trace in place
+    :param trace: trace dict
+    :return: trace dict
+    """
+    for key in COORDINATE_KEYS:
+        if trace.get(key) is not None:
+            trace[key] = encode_array(trace[key], np.float32)
+    # dimensions of scatter matrices
+    for dimension in trace.get('dimensions', []):
+        if dimension.get('values') is not None:
+            dimension['values'] = encode_array(dimension['values'], np.float32)
+    if trace.get('customdata') is not None:
+        trace['customdata'] = encode_customdata(trace['customdata'])
+    # per point colors of single trace plots
+    marker = trace.get('marker') or {}
+    if isinstance(marker.get('color'), (list, tuple, np.ndarray)):
+        marker['color'] = encode_column(marker['color'])
+    return trace
+
+
+def encode_figure(fig):
+    """
+    Encode all traces of a figure
+    :param fig: plotly figure
+    :return: figure dict
+    """
+    fig_dict = fig.to_dict()
+    for trace in fig_dict['data']:
+        encode_trace(trace)
+    fig_dict['layout']['meta'] = dict(fig_dict['layout'].get('meta') or {},
+                                      encoded=True)
+    return fig_dict
+
+
+def payload_size(fig):
+    """
+    Size of a figure serialized as JSON by dash
+    :param fig: plotly figure or figure dict
+    :return: size in bytes
+    """
+    return len(json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def get_mode():
+    """
+    Figure encoding set in config.ini
+    :return: tuple of 'json' or 'binary', whether to log payload sizes
+    """
+    config = ConfigParser()
+    config.read("./static/config.ini")
+    return config.get('Plot', 'figure_encoding', fallback='json'), \
+        config.getboolean('Plot', 'encoding_report', fallback=False)
+
+
+def prepare_figure(fig, name, points):
+    """
+    Encode a figure for the browser according to config.ini and optionally
+    log its bytes per point in both encodings
+    :param fig: plotly figure
+    :param name: name of the figure for the log
+    :param points: number of points in the figure
+    :return: figure or figure dict
+    """
+    mode, report = get_mode()
+    payload = encode_figure(fig) if mode == 'binary' else fig
+
+    if report and points:
+        before = payload_size(fig)
+        after = payload_size(payload) if mode == 'binary' \
+            else payload_size(encode_figure(fig))
+        print("[INFO] " + name + " payload for " + str(points) +
+              " points: json " + str(round(before / points, 1)) +
+              " bytes/point, binary " + str(round(after / points, 1)) +
+              " bytes/point")
+    return payload
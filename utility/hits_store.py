@@ -0,0 +1,106 @@
+"""
+Out-of-core storage of taxonomic hits in a local SQLite file, for hit tables
+too large to be kept in memory
+"""
+import os
+import sqlite3
+
+import pandas as pd
+
+from utility import cache
+
+TABLE = "taxonomic_hits"
+# name of the database in the cache folder of a dataset
+STORE_NAME = "taxonomic_hits_store"
+
+
+class SQLiteHitStore:
+    """
+    Taxonomic hits stored in SQLite with an index on qseqid
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+    def connect(self):
+        """
+        Open a read-only connection. Connections are cheap and can't be
+        shared between the threads of the dash server, so every query uses
+        its own.
+        :return: sqlite3 connection
+        """
+        return sqlite3.connect("file:" + self.db_file + "?mode=ro", uri=True)
+
+    def lookup(self, fasta_header):
+        """
+        Fetch all hits of a query, in the order of taxonomic_hits.txt
+        :param fasta_header: qseqid to look up
+        :return: pandas dataframe
+        """
+        connection = self.connect()
+        try:
+            return pd.read_sql_query(
+                "SELECT * FROM " + TABLE + " WHERE qseqid = ? ORDER BY rowid",
+                connection, params=[fasta_header])
+        finally:
+            connection.close()
+
+    def size(self):
+        """
+        Size of the database on disk
+        :return: size in bytes
+        """
+        return os.path.getsize(self.db_file)
+
+
+def ingest(db_file, chunks):
+    """
+    Write chunks of hits into a new SQLite database and index it by qseqid.
+    The database is built at a temporary location and moved into place
+    when complete.
+    :param db_file: path of the database
+    :param chunks: iterable of pandas dataframes
+    :return: number of rows written
+    """
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    # unique per process, several server workers may ingest at once
+    tmp_file = cache.temporary_file(db_file)
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+
+    rows = 0
+    connection = sqlite3.connect(tmp_file)
+    try:
+        # the database is a disposable cache, skip the journal
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        for chunk in chunks:
+            chunk.to_sql(TABLE, connection, if_exists='append', index=False)
+            rows += len(chunk.index)
+        connection.execute("CREATE INDEX IF NOT EXISTS qseqid_index ON " +
+                           TABLE + " (qseqid)")
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(tmp_file, db_file)
+    return rows
+
+
+def open_store(dataset_path, source_file, chunks):
+    """
+    Open the SQLite store of a dataset, ingesting the source file first if
+    the store is missing or outdated
+    :param dataset_path: path to the dataset
+    :param source_file: path to taxonomic_hits.txt
+    :param chunks: function returning an iterable of pandas dataframes
+    :return: SQLiteHitStore
+    """
+    db_file = cache.cache_file(dataset_path, STORE_NAME, ".sqlite")
+    if not cache.is_valid(dataset_path, STORE_NAME, source_file,
+                          suffix=".sqlite"):
+        key = cache.fingerprint(source_file)
+        key['tag'] = ""
+        rows = ingest(db_file, chunks())
+        cache.write_meta(dataset_path, STORE_NAME, key)
+        print("[INFO] Stored " + str(rows) + " taxonomic hits in " + db_file)
+    return SQLiteHitStore(db_file)
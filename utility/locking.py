@@ -0,0 +1,77 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Lock allowing many concurrent readers or a single writer. Waiting writers
+    block new readers, so a steady stream of reads can't starve a writer.
+    """
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        """
+        Wait until no writer holds or waits for the lock, then enter as reader
+        :return:
+        """
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        """
+        Leave as reader
+        :return:
+        """
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        """
+        Wait until all readers and writers have left, then enter as writer
+        :return:
+        """
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+
+    def release_write(self):
+        """
+        Leave as writer
+        :return:
+        """
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        """
+        Hold the lock as reader within a with block
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """
+        Hold the lock as writer within a with block
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,139 @@
+"""
+Figures of the PCA results and the dataset summary. None of them depend on
+the filters of the scatter plot, so they are built once per dataset and
+reused until their source files change.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objs as go
+
+PCA_PATH = "PCA_and_clustering/PCA_results/"
+SOURCE_FILES = [PCA_PATH + "pca_loadings.csv", PCA_PATH + "pca_summary.csv",
+                "gene_info/summary.txt"]
+
+# built figures by dataset path, with the mtimes of their source files
+pca_artifacts = {}
+pca_artifacts_lock = threading.Lock()
+
+
+def contribution_figure(path, dataset, glossary):
+    """
+    3D plot of the loadings of all variables on the first three PCs
+    :param path: path to the dataset
+    :param dataset: DataSet, to split variable names
+    :param glossary: variable descriptions
+    :return: plotly figure
+    """
+    contribution_data = pd.read_csv(path + PCA_PATH + "pca_loadings.csv")
+
+    labels_pca = []
+    details_list = []
+    for variable in contribution_data.iloc[:, 0]:
+        clean_name, my_number = dataset.clean_trailing_indices(variable)
+        if clean_name in glossary:
+            labels_pca.append(glossary[clean_name]['short'] + " " + my_number)
+            details_list.append(glossary[clean_name]["details"])
+        else:
+            labels_pca.append(variable)
+            details_list.append("")
+
+    contribution_fig = px.scatter_3d(contribution_data,
+                                     title="Contribution of variables",
+                                     x="PC1", y="PC2", z="PC3",
+                                     range_x=[-1, 1], range_y=[-1, 1],
+                                     range_z=[-1, 1],
+                                     color=labels_pca,
+                                     hover_data=[details_list],
+                                     height=550)
+
+    # one line from the origin to every point, interleaved with zeros
+    points = contribution_data[["PC1", "PC2", "PC3"]].to_numpy()
+    vectors = np.zeros((2 * len(points), 3))
+    vectors[1::2] = points
+    contribution_fig.add_traces(go.Scatter3d(name="Arrows", mode="lines",
+                                             x=vectors[:, 0],
+                                             y=vectors[:, 1],
+                                             z=vectors[:, 2],
+                                             showlegend=True,
+                                             hoverinfo='skip'))
+
+    contribution_fig.update_traces(textposition='top center',
+                                   marker_size=5,
+                                   hovertemplate=None)
+    # legend
+    contribution_fig.update_layout(legend=dict(orientation="v",
+                                               itemsizing='constant'))
+    return contribution_fig
+
+
+def scree_figure(path, pca_resolution=5):
+    """
+    Bar plot of the proportion of variance explained by the first PCs
+    :param path: path to the dataset
+    :param pca_resolution: number of PCs shown
+    :return: plotly figure
+    """
+    pca_data = pd.read_csv(path + PCA_PATH + "pca_summary.csv")
+    pca_ids = ["PC" + str(i) for i in range(1, pca_resolution + 1)]
+    # second row holds the proportion of variance
+    pca_data = pd.DataFrame(pca_data[pca_ids].iloc[1].to_numpy(), pca_ids)
+    scree_fig = px.bar(pca_data,
+                       title="Scree Plot",
+                       height=300)
+    scree_fig.update_layout(yaxis_title="Contribution to total variance",
+                            showlegend=False)
+    return scree_fig
+
+
+def read_summary(path):
+    """
+    Read the summary of the taXaminer run
+    :param path: path to the dataset
+    :return: string
+    """
+    try:
+        with open(path + 'gene_info/summary.txt') as f:
+            return f.read()
+    except FileNotFoundError:
+        return "File summary.txt not found"
+
+
+def source_mtimes(path):
+    """
+    Modification times of the source files of the figures
+    :param path: path to the dataset
+    :return: tuple
+    """
+    mtimes = []
+    for file in SOURCE_FILES:
+        try:
+            mtimes.append(os.stat(path + file).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def get_pca_artifacts(path, dataset, glossary):
+    """
+    Fetch summary, contribution and scree plot of a dataset, building them if
+    missing or outdated
+    :param path: path to the dataset
+    :param dataset: DataSet, to split variable names
+    :param glossary: variable descriptions
+    :return: tuple of summary, contribution figure, scree figure
+    """
+    mtimes = source_mtimes(path)
+    with pca_artifacts_lock:
+        entry = pca_artifacts.get(path)
+    if entry is not None and entry[0] == mtimes:
+        return entry[1]
+
+    artifacts = (read_summary(path), contribution_figure(path, dataset, glossary),
+                 scree_figure(path))
+    with pca_artifacts_lock:
+        pca_artifacts[path] = (mtimes, artifacts)
+    return artifacts
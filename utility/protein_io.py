@@ -1,5 +1,137 @@
 from Bio import SeqIO
+import io
+import mmap
 import os
+import threading
+import numpy as np
+import pandas as pd
+
+from utility import cache
+
+# open FASTA indices by path of the .faa file
+fasta_indices = {}
+fasta_indices_lock = threading.Lock()
+
+
+def build_fasta_index(fasta_file):
+    """
+    Scan a FASTA file once and record the byte range of every record
+    :param fasta_file: path to a FASTA file
+    :return: pandas dataframe with columns name, offset, length
+    """
+    names = []
+    offsets = []
+    offset = 0
+    with open(fasta_file, 'rb') as handle:
+        for line in handle:
+            if line.startswith(b'>'):
+                # SeqIO uses the first word of the header as record name
+                words = line[1:].split(None, 1)
+                names.append(words[0].decode() if words else "")
+                offsets.append(offset)
+            offset += len(line)
+
+    ends = np.append(np.array(offsets[1:], dtype=np.int64), offset)
+    index = pd.DataFrame({'name': pd.Series(names, dtype=object),
+                          'offset': np.array(offsets, dtype=np.int64),
+                          'length': ends - np.array(offsets, dtype=np.int64)})
+    # SeqIO.parse() would find the first of duplicated names
+    return index[~index['name'].duplicated()]
+
+
+class FastaIndex:
+    """
+    Random access to the records of a FASTA file via a persisted byte offset
+    index and a memory map of the file
+    """
+    def __init__(self, fasta_file, dataset_path):
+        self.fasta_file = fasta_file
+        self.stat = os.stat(fasta_file)
+
+        index = cache.load_frame(dataset_path, "proteins_index", fasta_file,
+                                 build_fasta_index)
+        self.names = pd.Index(index['name'])
+        self.offsets = index['offset'].to_numpy()
+        self.lengths = index['length'].to_numpy()
+
+        # mmap can't map empty files
+        self.handle = open(fasta_file, 'rb')
+        if self.stat.st_size > 0:
+            self.data = mmap.mmap(self.handle.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self.data = b""
+
+    def is_current(self):
+        """
+        Check whether the FASTA file is unchanged since the index was loaded
+        :return: bool
+        """
+        try:
+            stat = os.stat(self.fasta_file)
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == \
+               (self.stat.st_mtime_ns, self.stat.st_size)
+
+    def get_raw(self, name):
+        """
+        Get the raw bytes of a record, including its header line
+        :param name: record name
+        :return: bytes or None
+        """
+        position = self.names.get_indexer([name])[0]
+        if position < 0:
+            return None
+        start = self.offsets[position]
+        return self.data[start:start + self.lengths[position]]
+
+    def write_records(self, names, handle):
+        """
+        Stream the raw bytes of several records to a file. Records are
+        written once each, in the order of the FASTA file.
+        :param names: record names
+        :param handle: file handle opened in binary mode
+        :return: number of records written
+        """
+        positions = self.names.get_indexer(pd.Index(names).unique())
+        # sorted positions read the memory map front to back
+        positions = np.sort(positions[positions >= 0])
+        for position in positions:
+            start = self.offsets[position]
+            raw = self.data[start:start + self.lengths[position]]
+            handle.write(raw)
+            # the last record of a file may lack its line break
+            if not raw.endswith(b"\n"):
+                handle.write(b"\n")
+        return len(positions)
+
+    def get_record(self, name):
+        """
+        Get a single record
+        :param name: record name
+        :return: SeqIO.record or None
+        """
+        raw = self.get_raw(name)
+        if raw is None:
+            return None
+        return SeqIO.read(io.StringIO(raw.decode()), "fasta")
+
+
+def get_fasta_index(path):
+    """
+    Get the index of proteins.faa of a dataset, (re)building it if the file
+    has been modified
+    :param path: path to dataset
+    :return: FastaIndex
+    """
+    fasta_file = path + "/proteins.faa"
+    with fasta_indices_lock:
+        index = fasta_indices.get(fasta_file)
+        if index is None or not index.is_current():
+            index = FastaIndex(fasta_file, path)
+            fasta_indices[fasta_file] = index
+    return index
 
 
 def get_protein_record(prot_id, path):
@@ -10,10 +142,7 @@ def get_protein_record(prot_id, path):
     :return: SeqIO.record
     """
     try:
-        with open(path + "/proteins.faa") as handle:
-            for record in SeqIO.parse(handle, "fasta"):
-                if record.name == prot_id:
-                    return record
+        return get_fasta_index(path).get_record(prot_id)
     except FileNotFoundError:
         return None
 
@@ -25,18 +154,14 @@ def write_protein_sequences(genes, path):
     :param path:path to proteins.faa
     :return:filesystem path to new file
     """
-    as_sequences = []
-
     try:
-        with open(path + "/proteins.faa") as handle:
-            for record in SeqIO.parse(handle, "fasta"):
-                if record.name in genes:
-                    as_sequences.append(record)
+        index = get_fasta_index(path)
     except FileNotFoundError:
+        index = None
         print("[WARN] proteins.faa not found")
 
-    with open(path + "/selected_proteins.fasta", "w") as handle:
-        SeqIO.write(as_sequences, handle, "fasta")
+    with open(path + "/selected_proteins.fasta", "wb") as handle:
+        if index is not None:
+            index.write_records(genes, handle)
 
     return os.path.abspath(path + "/selected_proteins.fasta")
-
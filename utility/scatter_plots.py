@@ -0,0 +1,124 @@
+"""
+Single-trace scatter plots. In the 3D scatter plot all genes are drawn by one
+trace with a color code per point, the legend is built from label counts with
+dummy traces, so building the figure does not scale with the number of taxa.
+The scatter matrix is built once per filter state, selection changes only
+send a bit mask of the selected points.
+"""
+import base64
+
+import numpy as np
+import plotly.graph_objs as go
+
+# color of the taxa outside of the top labels
+OTHER_COLOR = "#BBBBBB"
+# columns of customdata, in the order of px.scatter_3d() in update_dataframe
+CUSTOM_DATA = ['taxa_color', 'g_name', 'best_hit', None, 'bh_evalue',
+               'plot_label', 'taxon_assignment', 'c_name']
+
+
+def top_labels(data, top_k):
+    """
+    Most frequent labels of the plot
+    :param data: plot data with the column plot_label_v
+    :param top_k: number of labels
+    :return: pandas series of counts of the top labels, remaining labels
+    """
+    counts = data['plot_label_v'].value_counts(sort=True)
+    return counts.iloc[:top_k], counts.index[top_k:].tolist()
+
+
+def single_trace_scatter(plot_data, data, header_name, top_k=20):
+    """
+    Build a 3D scatter plot with a single trace for all points
+    :param plot_data: plotted genes, possibly a sample of data
+    :param data: all genes passing the filters, for the legend counts
+    :param header_name: column of fasta headers
+    :param top_k: number of taxa with their own color and legend entry
+    :return: plotly figure
+    """
+    top, others = top_labels(data, top_k)
+
+    # colors as codes into a discrete colorscale, the last color is 'Other'
+    color_map = data.drop_duplicates('plot_label_v')\
+        .set_index('plot_label_v')['taxa_color']
+    palette = [color_map[label] for label in top.index] + [OTHER_COLOR]
+    codes = top.index.get_indexer(plot_data['plot_label_v'])
+    codes[codes < 0] = len(palette) - 1
+    colorscale = []
+    for i, color in enumerate(palette):
+        colorscale += [[i / len(palette), color],
+                       [(i + 1) / len(palette), color]]
+
+    custom_data = [header_name if col is None else col for col in CUSTOM_DATA]
+    # the visible taxa are read from meta, see the taxa_info1 callback
+    fig = go.Figure(go.Scatter3d(mode='markers', name="genes",
+                                 showlegend=False,
+                                 meta=top.index.tolist() + others))
+    # arrays are assigned to the trace of the figure, passing them to the
+    # constructors would deep copy them
+    trace = fig.data[0]
+    trace.x = plot_data['Dim.1'].to_numpy()
+    trace.y = plot_data['Dim.2'].to_numpy()
+    trace.z = plot_data['Dim.3'].to_numpy()
+    # code i is mapped to the middle of the band of color i
+    trace.marker = dict(color=codes, colorscale=colorscale, cmin=-0.5,
+                        cmax=len(palette) - 0.5, showscale=False)
+    trace.customdata = plot_data[custom_data].to_numpy(dtype=object)
+
+    # legend entries without points, in the order of their counts. They
+    # contribute no taxa (empty meta) and can't be toggled, as hiding them
+    # would hide no points.
+    legend = [(label, color_map[label]) for label in top.index]
+    if others:
+        legend.append(("Other (" + str(len(others)) + " taxa)", OTHER_COLOR))
+    for name, color in legend:
+        fig.add_trace(go.Scatter3d(x=[None], y=[None], z=[None],
+                                   mode='markers', name=name, meta=[],
+                                   marker=dict(color=color),
+                                   hoverinfo='skip'))
+
+    fig.update_layout(scene=dict(xaxis_title='Dim.1', yaxis_title='Dim.2',
+                                 zaxis_title='Dim.3'),
+                      legend=dict(itemclick=False, itemdoubleclick=False))
+    return fig
+
+
+# colors of unselected and selected genes in the scatter matrix
+MATRIX_COLORS = ["#636efa", "#DC143C"]
+
+
+def scatter_matrix(data, selected):
+    """
+    Build the scatter matrix of the first three dimensions as a single trace,
+    colored by selection state. Selection changes are applied clientside by
+    restyling the marker colors, see mask_payload().
+    :param data: plot data
+    :param selected: boolean array, selection state of the rows of data
+    :return: plotly figure
+    """
+    fig = go.Figure(go.Splom(name="genes", showlegend=False))
+    trace = fig.data[0]
+    trace.dimensions = [dict(label=dim, values=data[dim].to_numpy(),
+                             axis=dict(matches=True))
+                        for dim in ['Dim.1', 'Dim.2', 'Dim.3']]
+    trace.marker = dict(color=selected.astype(np.uint8), cmin=0, cmax=1,
+                        colorscale=[[0, MATRIX_COLORS[0]],
+                                    [1, MATRIX_COLORS[1]]])
+    # g_name is read from index 1 by the selection callbacks
+    trace.customdata = np.column_stack([selected,
+                                        data['g_name'].to_numpy(dtype=object)])
+    trace.hovertemplate = '%{customdata[1]}<br>%{xaxis.title.text}=%{x}<br>' \
+                          '%{yaxis.title.text}=%{y}<extra></extra>'
+    fig.update_layout(dragmode='select', margin=dict(t=60))
+    return fig
+
+
+def mask_payload(selected):
+    """
+    Pack the selection state of the scatter matrix points into bits
+    :param selected: boolean array
+    :return: dict with base64 bits and number of points
+    """
+    return {'bits': base64.b64encode(np.packbits(selected)).decode(),
+            'size': len(selected)}
@@ -0,0 +1,123 @@
+import threading
+
+import numpy as np
+
+
+class Selection:
+    """
+    Selection of dataset rows, stored as a boolean mask over row positions.
+    Dataframes passed to the frame helpers must be indexed by row position of
+    the dataset, as original_data and the output of get_plot_data() are.
+
+    Updates are copy-on-write: a changed mask is built aside and replaces the
+    current one in a single assignment, so readers never see a half-applied
+    update and don't need a lock. Readers must fetch self.mask only once per
+    operation.
+    """
+    def __init__(self, size):
+        self.mask = np.zeros(size, dtype=bool)
+        # serializes updates, so that concurrent ones don't get lost
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return int(np.count_nonzero(self.mask))
+
+    def update(self, change):
+        """
+        Apply a change to a copy of the mask and publish it
+        :param change: function modifying a mask in place
+        :return:
+        """
+        with self.lock:
+            mask = self.mask.copy()
+            change(mask)
+            self.mask = mask
+
+    def add(self, rows):
+        """
+        Add rows to the selection
+        :param rows: array of row positions
+        :return:
+        """
+        def change(mask):
+            mask[rows] = True
+        self.update(change)
+
+    def remove(self, rows):
+        """
+        Remove rows from the selection
+        :param rows: array of row positions
+        :return:
+        """
+        def change(mask):
+            mask[rows] = False
+        self.update(change)
+
+    def toggle(self, rows):
+        """
+        Flip the selection state of rows
+        :param rows: array of row positions
+        :return:
+        """
+        rows = np.unique(rows)
+
+        def change(mask):
+            mask[rows] = ~mask[rows]
+        self.update(change)
+
+    def invert(self):
+        """
+        Select all unselected rows and vice versa
+        :return:
+        """
+        def change(mask):
+            np.logical_not(mask, out=mask)
+        self.update(change)
+
+    def reset(self):
+        """
+        Clear the selection
+        :return:
+        """
+        def change(mask):
+            mask[:] = False
+        self.update(change)
+
+    def rows(self):
+        """
+        Positions of all selected rows
+        :return: numpy array
+        """
+        return np.flatnonzero(self.mask)
+
+    def is_selected(self, data):
+        """
+        Selection state of the rows of a dataframe
+        :param data: pandas dataframe indexed by row position
+        :return: boolean numpy array
+        """
+        return self.mask[data.index.to_numpy(dtype=np.intp)]
+
+    def merge(self, data):
+        """
+        Add a 'selected' column to a dataframe
+        :param data: pandas dataframe indexed by row position
+        :return: pandas dataframe
+        """
+        return data.assign(selected=self.is_selected(data))
+
+    def selected(self, data):
+        """
+        Filter a dataframe for selected rows
+        :param data: pandas dataframe indexed by row position
+        :return: pandas dataframe
+        """
+        return data[self.is_selected(data)]
+
+    def unselected(self, data):
+        """
+        Filter a dataframe for rows not selected
+        :param data: pandas dataframe indexed by row position
+        :return: pandas dataframe
+        """
+        return data[~self.is_selected(data)]
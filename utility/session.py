@@ -0,0 +1,572 @@
+"""
+Per-session state of the dashboard. Every browser tab gets a session id,
+stored in a dcc.Store, which maps to a Session on the server. DataSets are
+shared read-only between sessions, selections belong to the session.
+
+Sessions are kept in memory by default. Several server processes don't share
+their memory, so they need [Session] store = sqlite, which keeps the state
+in a database file all processes use.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from configparser import ConfigParser
+
+import numpy as np
+
+from utility import dataset as ds
+from utility.selection import Selection
+
+
+class SessionDataSet:
+    """
+    A shared DataSet combined with the selection of one session. Everything
+    but the selection is read from the shared DataSet, which holds no
+    selection of its own. Instances are not changed after creation, a
+    dataset switch replaces the whole object.
+    """
+    def __init__(self, dataset, selection, path=None):
+        self.dataset = dataset
+        self.selection = selection
+        self.path = path
+
+    def __getattr__(self, name):
+        return getattr(self.dataset, name)
+
+    def selected_merge(self, data=None):
+        """
+        Add a 'selected' column to a dataframe
+        :param data: pandas dataframe, defaults to all genes
+        :return: pandas dataframe
+        """
+        return self.dataset.selected_merge(self.selection, data)
+
+    def get_selected_data(self, data=None):
+        """
+        Get the selected rows of a dataframe
+        :param data: pandas dataframe, defaults to all genes
+        :return: pandas dataframe
+        """
+        return self.dataset.get_selected_data(self.selection, data)
+
+    def get_unselected_data(self, data=None):
+        """
+        Get the rows of a dataframe not selected
+        :param data: pandas dataframe, defaults to all genes
+        :return: pandas dataframe
+        """
+        return self.dataset.get_unselected_data(self.selection, data)
+
+    def get_selected_keys(self):
+        """
+        Get the g_names of all selected rows
+        :return: list of g_names
+        """
+        return self.dataset.get_selected_keys(self.selection)
+
+    def get_selected_fasta_headers(self):
+        """
+        Get the fasta_headers of all selected rows
+        :return: list of fasta_headers
+        """
+        return self.dataset.get_selected_fasta_headers(self.selection)
+
+    def export_csv(self, cols, path):
+        """
+        Export the selected rows to .csv
+        :param cols: columns to export
+        :param path: path to the dataset
+        :return: path of the .csv file
+        """
+        return self.dataset.export_csv(self.selection, cols, path)
+
+    def select(self, key):
+        """
+        Add a key to the selection
+        :param key: the g_name
+        :return:
+        """
+        self.select_keys([key])
+
+    def unselect(self, key):
+        """
+        Remove a key from the selection
+        :param key: the g_name
+        :return:
+        """
+        self.unselect_keys([key])
+
+    def select_keys(self, keys):
+        """
+        Add several keys to the selection at once
+        :param keys: iterable of g_names
+        :return:
+        """
+        self.selection.add(self.dataset.get_rows(keys))
+
+    def unselect_keys(self, keys):
+        """
+        Remove several keys from the selection at once
+        :param keys: iterable of g_names
+        :return:
+        """
+        self.selection.remove(self.dataset.get_rows(keys))
+
+    def toggle_keys(self, keys):
+        """
+        Flip the selection state of several keys at once
+        :param keys: iterable of g_names
+        :return:
+        """
+        self.selection.toggle(self.dataset.get_rows(keys))
+
+    def invert_selection(self):
+        """
+        Select all unselected genes and vice versa
+        :return:
+        """
+        self.selection.invert()
+
+    def reset_selection(self):
+        """
+        Dump all keys
+        :return:
+        """
+        self.selection.reset()
+
+
+class Session:
+    """
+    State of one browser session. Callbacks of the same session may run
+    concurrently, they should fetch self.dataset once and use its path, so
+    that a dataset switch in between can't mix two datasets.
+    """
+    def __init__(self, session_id, empty_dataset, load_dataset):
+        self.session_id = session_id
+        self.last_seen = time.time()
+        self.lock = threading.Lock()
+        self.empty_dataset = empty_dataset
+        self.load_dataset = load_dataset
+
+        # path of the current dataset, only the path is kept so that the
+        # DataSetCache can free datasets the session doesn't use right now
+        self.path = None
+        # selections are kept across dataset switches
+        self.selections = {}
+
+        # legend state
+        self.label_dictionary = {}
+        self.legend_order = {}
+
+        # selection mode and recent inputs
+        self.is_select_mode = False
+        self.is_remove_mode = False
+        self.recent_click_data = None
+        self.recent_click_scat_data = None
+        self.recent_select_data = None
+        self.last_selection = None
+        # counter of selection changes
+        self.selection_version = 0
+        self.is_dataset_switch = False
+        self.lock_contigs = False
+
+    @property
+    def dataset(self):
+        """
+        Current dataset with the selection of the session, fetched from the
+        DataSetCache on every access
+        """
+        path = self.path
+        if path is None:
+            return SessionDataSet(self.empty_dataset, Selection(0))
+        return self.combine(path, self.load_dataset(path))
+
+    def combine(self, path, dataset):
+        """
+        Combine a dataset with the selection of the session in it
+        :param path: path to the dataset
+        :param dataset: shared DataSet
+        :return: SessionDataSet
+        """
+        size = len(dataset.original_data.index)
+        with self.lock:
+            selection = self.selections.get(path)
+            # the dataset may have been reloaded with a different number of
+            # genes
+            if selection is None or len(selection.mask) != size:
+                selection = Selection(size)
+                self.selections[path] = selection
+        return SessionDataSet(dataset, selection, path)
+
+    def switch_dataset(self, path, dataset):
+        """
+        Make a dataset the current one, restoring the previous selection of
+        the session in it
+        :param path: path to the dataset
+        :param dataset: shared DataSet
+        :return: the new SessionDataSet
+        """
+        session_dataset = self.combine(path, dataset)
+        self.path = path
+        return session_dataset
+
+    def next_selection_version(self):
+        """
+        Count a selection change
+        :return: new counter value
+        """
+        with self.lock:
+            self.selection_version += 1
+            return self.selection_version
+
+
+class SessionStore:
+    """
+    Sessions by id. Sessions unused for longer than the configured timeout
+    are dropped.
+    """
+    def __init__(self, load_dataset, empty_dataset=None):
+        config = ConfigParser()
+        config.read("./static/config.ini")
+        self.timeout = config.getint('Session', 'timeout_minutes',
+                                     fallback=240) * 60
+        self.load_dataset = load_dataset
+        self.empty_dataset = empty_dataset or ds.DataSet()
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def new_id():
+        """
+        Generate a session id
+        :return: string
+        """
+        return str(uuid.uuid4())
+
+    def get(self, session_id):
+        """
+        Fetch a session, creating it if unknown, e.g. after a restart of
+        the server
+        :param session_id: id from the session-id store
+        :return: Session
+        """
+        now = time.time()
+        with self.lock:
+            for key in [key for key, session in self.sessions.items()
+                        if now - session.last_seen > self.timeout]:
+                del self.sessions[key]
+
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.empty_dataset,
+                                  self.load_dataset)
+                self.sessions[session_id] = session
+            session.last_seen = now
+        return session
+
+
+# state of a SharedSession with its initial values
+SHARED_FIELDS = {
+    'label_dictionary': {},
+    'legend_order': {},
+    'is_select_mode': False,
+    'is_remove_mode': False,
+    'recent_click_data': None,
+    'recent_click_scat_data': None,
+    'recent_select_data': None,
+    'last_selection': None,
+    'selection_version': 0,
+    'is_dataset_switch': False,
+    'lock_contigs': False,
+}
+
+
+class SharedSelection(Selection):
+    """
+    Selection of a session kept in the session database, as a packed bit
+    mask. Every read fetches the current mask, updates are applied within a
+    database transaction, so concurrent updates from several processes don't
+    get lost.
+    """
+    def __init__(self, store, session_id, path, size):
+        self.store = store
+        self.session_id = session_id
+        self.path = path
+        self.size = size
+
+    @property
+    def mask(self):
+        return self.store.read_mask(self.session_id, self.path, self.size)
+
+    def update(self, change):
+        """
+        Apply a change to the stored mask
+        :param change: function modifying a mask in place
+        :return:
+        """
+        self.store.update_mask(self.session_id, self.path, self.size, change)
+
+
+class SharedSession:
+    """
+    State of one browser session kept in the session database. Offers the
+    attributes of Session, but every access reads or writes the database,
+    so all server processes see the same state.
+    """
+    def __init__(self, store, session_id):
+        object.__setattr__(self, 'store', store)
+        object.__setattr__(self, 'session_id', session_id)
+
+    def __getattr__(self, name):
+        if name not in SHARED_FIELDS:
+            raise AttributeError(name)
+        return self.store.read_field(self.session_id, name)
+
+    def __setattr__(self, name, value):
+        if name not in SHARED_FIELDS:
+            raise AttributeError(name)
+        self.store.write_field(self.session_id, name, value)
+
+    @property
+    def dataset(self):
+        """
+        Current dataset with the selection of the session, built anew on
+        every access
+        """
+        path = self.store.read_field(self.session_id, 'path')
+        if path is None:
+            return SessionDataSet(self.store.empty_dataset, Selection(0))
+        dataset = self.store.load_dataset(path)
+        selection = SharedSelection(self.store, self.session_id, path,
+                                    len(dataset.original_data.index))
+        return SessionDataSet(dataset, selection, path)
+
+    @property
+    def path(self):
+        """
+        Path of the current dataset, None before one was picked
+        """
+        return self.store.read_field(self.session_id, 'path')
+
+    def switch_dataset(self, path, dataset):
+        """
+        Make a dataset the current one, restoring the previous selection of
+        the session in it
+        :param path: path to the dataset
+        :param dataset: shared DataSet
+        :return: the new SessionDataSet
+        """
+        # a stored mask of another size, from before a reload of the
+        # dataset, reads as empty selection
+        selection = SharedSelection(self.store, self.session_id, path,
+                                    len(dataset.original_data.index))
+        self.store.write_field(self.session_id, 'path', path)
+        return SessionDataSet(dataset, selection, path)
+
+    def next_selection_version(self):
+        """
+        Count a selection change
+        :return: new counter value
+        """
+        return self.store.increment(self.session_id, 'selection_version')
+
+
+class SQLiteSessionStore:
+    """
+    Sessions by id, kept in a SQLite file shared by all server processes.
+    Sessions unused for longer than the configured timeout are dropped.
+    """
+    def __init__(self, db_file, load_dataset, empty_dataset=None):
+        config = ConfigParser()
+        config.read("./static/config.ini")
+        self.timeout = config.getint('Session', 'timeout_minutes',
+                                     fallback=240) * 60
+        self.db_file = db_file
+        self.load_dataset = load_dataset
+        self.empty_dataset = empty_dataset or ds.DataSet()
+        self.last_expiry = 0
+
+        connection = self.connect()
+        try:
+            # readers don't block the writer and vice versa
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                               "(session_id TEXT PRIMARY KEY, last_seen REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS fields "
+                               "(session_id TEXT, name TEXT, value TEXT, "
+                               "PRIMARY KEY (session_id, name))")
+            connection.execute("CREATE TABLE IF NOT EXISTS selections "
+                               "(session_id TEXT, path TEXT, size INTEGER, "
+                               "mask BLOB, PRIMARY KEY (session_id, path))")
+        finally:
+            connection.close()
+
+    def connect(self):
+        """
+        Open a connection in autocommit mode. Connections can't be shared
+        between the threads of the dash server, so every access uses its own.
+        :return: sqlite3 connection
+        """
+        return sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def new_id():
+        """
+        Generate a session id
+        :return: string
+        """
+        return SessionStore.new_id()
+
+    def get(self, session_id):
+        """
+        Fetch a session, creating it if unknown
+        :param session_id: id from the session-id store
+        :return: SharedSession
+        """
+        now = time.time()
+        connection = self.connect()
+        try:
+            connection.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?)",
+                               (session_id, now))
+            # at most once a minute per process
+            if now - self.last_expiry > 60:
+                self.last_expiry = now
+                expired = "SELECT session_id FROM sessions WHERE last_seen < ?"
+                for table in ['fields', 'selections', 'sessions']:
+                    connection.execute("DELETE FROM " + table + " WHERE "
+                                       "session_id IN (" + expired + ")",
+                                       (now - self.timeout,))
+        finally:
+            connection.close()
+        return SharedSession(self, session_id)
+
+    def read_field(self, session_id, name):
+        """
+        Read a value of a session
+        :param session_id: id of the session
+        :param name: name of the value
+        :return: stored value or its initial value
+        """
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT value FROM fields WHERE "
+                                     "session_id = ? AND name = ?",
+                                     (session_id, name)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return json.loads(json.dumps(SHARED_FIELDS.get(name)))
+        return json.loads(row[0])
+
+    def write_field(self, session_id, name, value):
+        """
+        Store a value of a session
+        :param session_id: id of the session
+        :param name: name of the value
+        :param value: JSON serializable value
+        :return:
+        """
+        connection = self.connect()
+        try:
+            connection.execute("INSERT OR REPLACE INTO fields VALUES (?, ?, ?)",
+                               (session_id, name, json.dumps(value)))
+        finally:
+            connection.close()
+
+    def increment(self, session_id, name):
+        """
+        Add one to a counter of a session
+        :param session_id: id of the session
+        :param name: name of the counter
+        :return: new value
+        """
+        connection = self.connect()
+        try:
+            # take the write lock before reading, so that no other process
+            # can increment in between
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT value FROM fields WHERE "
+                                     "session_id = ? AND name = ?",
+                                     (session_id, name)).fetchone()
+            value = (json.loads(row[0]) if row else SHARED_FIELDS[name]) + 1
+            connection.execute("INSERT OR REPLACE INTO fields VALUES (?, ?, ?)",
+                               (session_id, name, json.dumps(value)))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return value
+
+    @staticmethod
+    def fetch_mask(connection, session_id, path, size):
+        """
+        Read a selection mask with an open connection
+        :param connection: sqlite3 connection
+        :param session_id: id of the session
+        :param path: path to the dataset
+        :param size: number of genes of the dataset
+        :return: boolean numpy array, empty selection if none of that size
+        is stored
+        """
+        row = connection.execute("SELECT size, mask FROM selections WHERE "
+                                 "session_id = ? AND path = ?",
+                                 (session_id, path)).fetchone()
+        if row is None or row[0] != size:
+            return np.zeros(size, dtype=bool)
+        return np.unpackbits(np.frombuffer(row[1], dtype=np.uint8),
+                             count=size).astype(bool)
+
+    def read_mask(self, session_id, path, size):
+        """
+        Read the selection of a session in a dataset
+        :param session_id: id of the session
+        :param path: path to the dataset
+        :param size: number of genes of the dataset
+        :return: boolean numpy array
+        """
+        connection = self.connect()
+        try:
+            return self.fetch_mask(connection, session_id, path, size)
+        finally:
+            connection.close()
+
+    def update_mask(self, session_id, path, size, change):
+        """
+        Change the selection of a session in a dataset
+        :param session_id: id of the session
+        :param path: path to the dataset
+        :param size: number of genes of the dataset
+        :param change: function modifying a mask in place
+        :return:
+        """
+        connection = self.connect()
+        try:
+            # the write lock is held from reading the mask until the changed
+            # one is stored
+            connection.execute("BEGIN IMMEDIATE")
+            mask = self.fetch_mask(connection, session_id, path, size)
+            change(mask)
+            connection.execute("INSERT OR REPLACE INTO selections "
+                               "VALUES (?, ?, ?, ?)",
+                               (session_id, path, size,
+                                np.packbits(mask).tobytes()))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+
+def open_store(empty_dataset, load_dataset):
+    """
+    Create the session store set in the config
+    :param empty_dataset: placeholder DataSet until a session picks one
+    :param load_dataset: function returning the shared DataSet of a path
+    :return: SessionStore or SQLiteSessionStore
+    """
+    config = ConfigParser()
+    config.read("./static/config.ini")
+    if config.get('Session', 'store', fallback='memory') == 'sqlite':
+        db_file = config.get('Session', 'store_file',
+                             fallback='./data/.sessions.sqlite')
+        return SQLiteSessionStore(db_file, load_dataset, empty_dataset)
+    return SessionStore(load_dataset, empty_dataset)
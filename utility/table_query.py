@@ -0,0 +1,158 @@
+"""
+Server-side paging, sorting and filtering of the data tables. The tables use
+page_action, sort_action and filter_action 'custom', only the visible page is
+sent to the browser.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+# operators of the DataTable filter syntax, with their spellings
+OPERATORS = [['ge ', '>='],
+             ['le ', '<='],
+             ['lt ', '<'],
+             ['gt ', '>'],
+             ['ne ', '!='],
+             ['eq ', '='],
+             ['contains '],
+             ['datestartswith ']]
+
+# row order of recent queries, by table
+query_cache = OrderedDict()
+query_cache_lock = threading.Lock()
+QUERY_CACHE_SIZE = 8
+
+
+def split_filter_part(filter_part):
+    """
+    Split a single condition of a filter query, e.g. '{bh_evalue} s< 1e-5'
+    :param filter_part: condition
+    :return: tuple of column, operator, value or None if invalid
+    """
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator not in filter_part:
+                continue
+            name_part, value_part = filter_part.split(operator, 1)
+            name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+            value_part = value_part.strip()
+            v0 = value_part[0] if value_part else ""
+            if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                value = value_part[1: -1].replace('\\' + v0, v0)
+            elif operator_type[0] in ('contains ', 'datestartswith '):
+                # text match, '1' must not become '1.0'
+                value = value_part
+            else:
+                try:
+                    value = float(value_part)
+                except ValueError:
+                    value = value_part
+
+            # word operators need spaces after them in the filter string,
+            # but we don't want these later
+            return name, operator_type[0].strip(), value
+    return None
+
+
+def apply_filter(data, filter_query):
+    """
+    Filter a dataframe by a DataTable filter query
+    :param data: pandas dataframe
+    :param filter_query: conditions joined by ' && '
+    :return: boolean mask
+    """
+    mask = None
+    for filter_part in (filter_query or "").split(' && '):
+        condition = split_filter_part(filter_part)
+        if condition is None:
+            continue
+        col_name, operator, value = condition
+        if col_name not in data.columns:
+            continue
+        column = data[col_name]
+
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            try:
+                part = getattr(column, operator)(value)
+            except TypeError:
+                # e.g. numbers compared to text
+                part = getattr(column.astype(str), operator)(str(value))
+        elif operator == 'contains':
+            part = column.astype(str).str.contains(str(value), regex=False)
+        else:
+            # datestartswith
+            part = column.astype(str).str.startswith(str(value))
+        mask = part if mask is None else mask & part
+    return mask
+
+
+def query_rows(table, data, sort_by, filter_query, source=None,
+               source_key=None):
+    """
+    Row positions of a dataframe after filtering and sorting. If the table is
+    derived from a memoized frame, the result is kept so that paging does not
+    sort again.
+    :param table: id of the table
+    :param data: pandas dataframe
+    :param sort_by: sort_by of the DataTable
+    :param filter_query: filter_query of the DataTable
+    :param source: memoized frame data was derived from, None to not cache
+    :param source_key: hashable description of how data was derived
+    :return: array of row positions
+    """
+    sort_by = [s for s in (sort_by or []) if s['column_id'] in data.columns]
+    key = (table, source_key, filter_query or "",
+           tuple((s['column_id'], s['direction']) for s in sort_by))
+    if source is not None:
+        with query_cache_lock:
+            entry = query_cache.get(key)
+            # the entry keeps its source alive, so identity is safe
+            if entry is not None and entry[0] is source:
+                query_cache.move_to_end(key)
+                return entry[1]
+
+    rows = data.reset_index(drop=True)
+    mask = apply_filter(rows, filter_query)
+    if mask is not None:
+        rows = rows[mask.to_numpy(dtype=bool)]
+    if sort_by:
+        rows = rows.sort_values([s['column_id'] for s in sort_by],
+                                ascending=[s['direction'] == 'asc'
+                                           for s in sort_by],
+                                kind='mergesort')
+    positions = rows.index.to_numpy()
+
+    if source is not None:
+        with query_cache_lock:
+            query_cache[key] = (source, positions)
+            while len(query_cache) > QUERY_CACHE_SIZE:
+                query_cache.popitem(last=False)
+    return positions
+
+
+def get_page(table, data, page_current, page_size, sort_by=None,
+             filter_query=None, source=None, source_key=None, id_col='g_name'):
+    """
+    Fetch the visible page of a table
+    :param table: id of the table
+    :param data: pandas dataframe with all rows of the table
+    :param page_current: index of the page
+    :param page_size: rows per page
+    :param sort_by: sort_by of the DataTable
+    :param filter_query: filter_query of the DataTable
+    :param source: memoized frame data was derived from, see query_rows()
+    :param source_key: hashable description of how data was derived
+    :param id_col: column used as row id, for active_cell['row_id']
+    :return: tuple of list of records, number of pages, index of the page.
+    The page index is moved to the last page if a filter or sort change left
+    fewer pages.
+    """
+    positions = query_rows(table, data, sort_by, filter_query, source,
+                           source_key)
+    page_count = max(math.ceil(len(positions) / page_size), 1)
+    page_current = min(page_current or 0, page_count - 1)
+    page = data.iloc[positions[page_current * page_size:
+                               (page_current + 1) * page_size]]
+    records = page.assign(id=page[id_col]).to_dict('records')
+    return records, page_count, page_current
@@ -2,6 +2,7 @@
 This module covers additional methods for interactions with 3d plots
 """
 import numpy as np
+import pandas as pd
 
 
 def rotate_z(x, y, z, theta):
@@ -16,3 +17,118 @@ def rotate_z(x, y, z, theta):
     c = x+1j*y
     return np.real(np.exp(1j*theta)*c), np.imag(np.exp(1j*theta)*c), z
 
+
+def rotation_path(x, y, z, thetas):
+    """
+    Calculate all camera positions of a rotation around the z axis at once
+    :param x: x coordinate of the start position
+    :param y: y coordinate of the start position
+    :param z: z coordinate of the start position
+    :param thetas: array of rotation steps
+    :return: dict of lists of x, y, z coordinates
+    """
+    xs, ys, _ = rotate_z(x, y, z, np.asarray(thetas, dtype=float))
+    return {'x': xs.tolist(), 'y': ys.tolist(), 'z': [z] * len(xs)}
+
+
+def unit_cube(coordinates):
+    """
+    Scale points into the unit cube spanned by their bounding box
+    :param coordinates: n x 3 array
+    :return: n x 3 array with values in [0, 1]
+    """
+    low = np.nanmin(coordinates, axis=0)
+    extent = np.nanmax(coordinates, axis=0) - low
+    extent[extent == 0] = 1
+    return (coordinates - low) / extent
+
+
+def voxel_codes(unit, resolution):
+    """
+    Assign points to the cells of a regular grid over the unit cube
+    :param unit: n x 3 array with values in [0, 1]
+    :param resolution: number of cells per axis
+    :return: array of cell ids
+    """
+    cells = np.minimum((unit * resolution).astype(np.int64), resolution - 1)
+    return (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+
+
+def voxel_sample(data, budget, label_col='plot_label_v', rare_points=10,
+                 keep=None, dims=('Dim.1', 'Dim.2', 'Dim.3'), seed=0):
+    """
+    Spatially stratified sample of at most budget points (plus the points of
+    keep): one point per occupied cell of a voxel grid, plus up to
+    rare_points points of every label, so that rare taxa stay visible. The
+    labels take at most half of the budget, with more labels than that the
+    rarest ones get one point each. The grid resolution is the finest one
+    with no more occupied cells than the rest of the budget allows.
+    :param data: pandas dataframe with coordinates and labels
+    :param budget: number of points to keep
+    :param label_col: column of the plot labels
+    :param rare_points: minimum number of points kept per label
+    :param keep: boolean array of points to keep in any case
+    :param dims: coordinate columns
+    :param seed: seed of the random choice of points, for stable plots
+    :return: pandas dataframe, subset of data
+    """
+    if len(data.index) <= budget:
+        return data
+
+    # random order, the first point of a cell / label is kept
+    order = np.random.default_rng(seed).permutation(len(data.index))
+    unit = np.nan_to_num(
+        unit_cube(data[list(dims)].to_numpy(dtype=float)[order]))
+
+    chosen = np.zeros(len(data.index), dtype=bool)
+    if keep is not None:
+        chosen |= np.asarray(keep, dtype=bool)[order]
+    labels = pd.Series(data[label_col].to_numpy()[order])
+    rank = labels.groupby(labels, sort=False).cumcount()
+    # sorted by descending count
+    counts = labels.value_counts()
+    quota = min(rare_points, (budget // 2) // max(len(counts.index), 1))
+    if quota:
+        chosen |= (rank < quota).to_numpy()
+    else:
+        rarest = counts.index[::-1][:budget // 2]
+        chosen |= ((rank == 0) & labels.isin(rarest)).to_numpy()
+    remaining = max(budget - int(np.count_nonzero(chosen)), 1)
+
+    # binary search for the finest grid within the remaining budget, a grid
+    # with no more cells than the budget always fits
+    low, high = max(int(remaining ** (1 / 3)), 1), 1024
+    while low < high:
+        resolution = (low + high + 1) // 2
+        if len(np.unique(voxel_codes(unit, resolution))) <= remaining:
+            low = resolution
+        else:
+            high = resolution - 1
+    codes = voxel_codes(unit, low)
+    _, first = np.unique(codes, return_index=True)
+    chosen[first] = True
+
+    # back to the row order of data
+    return data.iloc[np.sort(order[chosen])]
+
+
+def camera_region(data, camera, dims=('Dim.1', 'Dim.2', 'Dim.3'), fov=45):
+    """
+    Approximate the points in view of a scene camera: the ball around the
+    camera center which fills the field of view at the current zoom. Scene
+    coordinates span [-0.5, 0.5] per axis, so at the default camera the ball
+    covers the whole plot.
+    :param data: pandas dataframe with coordinates
+    :param camera: scene camera dict with eye and center
+    :param dims: coordinate columns
+    :param fov: vertical field of view in degrees
+    :return: boolean numpy array
+    """
+    scene = unit_cube(data[list(dims)].to_numpy(dtype=float)) - 0.5
+
+    center = camera.get('center') or {}
+    center = np.array([center.get(axis, 0) for axis in 'xyz'], dtype=float)
+    eye = camera.get('eye') or {}
+    eye = np.array([eye.get(axis, 1.25) for axis in 'xyz'], dtype=float)
+    radius = np.linalg.norm(eye - center) * np.tan(np.radians(fov) / 2)
+    return np.linalg.norm(scene - center, axis=1) <= radius
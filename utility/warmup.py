@@ -0,0 +1,122 @@
+"""
+Pre-warming of dataset caches at server start. Every dataset is loaded once in
+a worker process, which writes the .feather / SQLite caches and the FASTA
+index to disk, so that interactive loads only read warm caches.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from configparser import ConfigParser
+
+import pyarrow as pa
+
+from utility import dataset as ds
+from utility import protein_io
+
+
+def init_worker(threads):
+    """
+    Limit the threads of Arrow in a worker, the pool already spreads the
+    datasets over all cores
+    :param threads: number of threads per worker
+    :return:
+    """
+    pa.set_cpu_count(threads)
+    pa.set_io_thread_count(threads)
+
+
+def warm_dataset(path):
+    """
+    Build all caches and indices of a dataset
+    :param path: path to the dataset
+    :return: dict of timings in seconds
+    """
+    timings = {}
+    start = time.perf_counter()
+    dataset = ds.DataSet(path)
+    timings['gene_table'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dataset.wait_for_hits()
+    timings['taxonomic_hits'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        protein_io.get_fasta_index(path)
+    except FileNotFoundError:
+        print("[WARN] proteins.faa not found in " + path)
+    timings['proteins_index'] = time.perf_counter() - start
+    return timings
+
+
+def prewarm(paths, workers=None):
+    """
+    Warm the caches of several datasets in parallel
+    :param paths: paths to the datasets
+    :param workers: number of processes, defaults to the number of cores
+    :return: dict of timings per dataset path
+    """
+    if not paths:
+        return {}
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, len(paths))
+    threads = max(1, cores // workers)
+    print("[INFO] Warming " + str(len(paths)) + " datasets with " +
+          str(workers) + " processes")
+
+    results = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threads,)) as pool:
+        futures = {pool.submit(warm_dataset, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                timings = future.result()
+            except Exception as e:
+                print("[WARN] Failed to warm " + path + ": " + str(e))
+                continue
+            results[path] = timings
+            print("[INFO] Warmed " + path + " in " +
+                  str(round(sum(timings.values()), 2)) + " s (" +
+                  ", ".join(key + " " + str(round(value, 2)) + " s"
+                            for key, value in timings.items()) + ")")
+    print("[INFO] Warmed all datasets in " +
+          str(round(time.perf_counter() - start, 2)) + " s")
+    return results
+
+
+def is_enabled():
+    """
+    Check whether pre-warming is switched on, either in config.ini or via the
+    TAXAMINER_PREWARM environment variable
+    :return: tuple of bool, number of workers (0 for all cores)
+    """
+    config = ConfigParser()
+    config.read("./static/config.ini")
+    enabled = config.getboolean('Warmup', 'enabled', fallback=False)
+    if os.environ.get("TAXAMINER_PREWARM"):
+        enabled = os.environ["TAXAMINER_PREWARM"].lower() in ["1", "true", "yes"]
+    return enabled, config.getint('Warmup', 'workers', fallback=0)
+
+
+def is_reloader_child():
+    """
+    Check whether this is the server process restarted by the reloader of
+    debug mode. Its parent process has already run the warmup.
+    :return: bool
+    """
+    return os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+
+if __name__ == "__main__":
+    # build the caches once before starting several server workers, e.g.
+    #   python -m utility.warmup && gunicorn -w 4 app:server
+    # with [Session] store = sqlite, so that the workers share the sessions.
+    # With [Cache] shared_memory the workers then map the same files.
+    from utility.catalog import DatasetCatalog
+
+    catalog = DatasetCatalog("./data/")
+    catalog.scan()
+    prewarm(sys.argv[1:] or catalog.paths(), is_enabled()[1])